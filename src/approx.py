@@ -1,186 +1,252 @@
-import gurobipy as gb
-from gurobipy import GRB
-from table import Table
+from conflict_graph import build_conflict_graph
+from exact import rs_model
+from linear_model import solve
+from compression import CompressedTable
 import numpy as np
 from utility import global_random_seed, eps
 from color_distribution import ColorDistribution
-import copy
-
-
-def approx(t, delta, rc, method="GRB_LP_ROUNDING", seed=None):
+import heapq
+import pandas as pd
+from collections import OrderedDict
+from time import time
+import tracing
+
+
+def approx(
+    t,
+    delta,
+    rc,
+    method="GRB_LP_ROUNDING",
+    seed=None,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    backend="GRB",
+    budget=None,
+):
     if method in [
         "GRB_LP_ROUNDING",
         "GRB_LP_GREEDY_ROUNDING",
         "GRB_LP_NEW_GREEDY_ROUNDING",
     ]:
         return approx_by_grb_lp_rounding(
-            t, delta, rc, rounding_method=method[4:], seed=seed
+            t,
+            delta,
+            rc,
+            rounding_method=method[4:],
+            seed=seed,
+            fd_encoding=fd_encoding,
+            compress=compress,
+            backend=backend,
+            budget=budget,
         )
     raise ValueError("Not Supported Optimizer")
 
 
-def approx_by_grb_lp_rounding(t, delta, rc, rounding_method, seed):
+# the LP relaxations solved in this run, shared by all the roundings; keyed on the
+# content of the table, the FD set and the RC, and on the way the LP is built
+_lp_cache = OrderedDict()
+_LP_CACHE_SIZE = 8
+
+
+def _lp_cache_key(t, delta, rc, seed, fd_encoding, compress, backend):
+    return (
+        tuple(t.df.columns),
+        t.representative_column,
+        hash(pd.util.hash_pandas_object(t.df, index=False).to_numpy().tobytes()),
+        repr(delta),
+        tuple((label, rc.constraint[label]) for label in rc.labels),
+        seed,
+        fd_encoding,
+        compress,
+        backend,
+    )
+
+
+# the LP relaxation of globalilp (constraints for FDs and RC), solved once per
+# (table, FD set, RC) and cached for the other roundings; a rounding that reuses it
+# adds the time it took to build and solve to budget.reused_time, so that every
+# rounding is timed with its LP
+# output: (the CompressedTable or None, the conflict graph of its tuples (classes),
+#          the value of each tuple (class) variable, or None if no solution was
+#          found within the time limit)
+def solve_lp_relaxation(
+    t,
+    delta,
+    rc,
+    seed,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    backend="GRB",
+    budget=None,
+):
+    key = _lp_cache_key(t, delta, rc, seed, fd_encoding, compress, backend)
+    if key in _lp_cache:
+        tracing.count("lp_cache_hits")
+        _lp_cache.move_to_end(key)
+        ct, graph, values, lp_time = _lp_cache[key]
+        if budget is not None:
+            budget.reused_time += lp_time
+        return ct, graph, values
+
+    start_ts = time()
+    # identical tuples (w.r.t. FDs and RC) share one variable, rounded as a whole
+    ct = CompressedTable(t, delta) if compress else None
+    _t = ct.table if compress else t
+    graph = build_conflict_graph(_t.df, delta)
+    model, x, _, _ = rs_model(
+        _t,
+        delta,
+        rc,
+        fd_encoding,
+        ct.counts if compress else None,
+        integer=False,
+        graph=graph,
+    )
+    v = solve(model, backend, seed=seed, budget=budget)
+    if v is None:
+        return ct, graph, None
+
+    _lp_cache[key] = (ct, graph, v[x], time() - start_ts)
+    if len(_lp_cache) > _LP_CACHE_SIZE:
+        _lp_cache.popitem(last=False)
+    return ct, graph, v[x]
+
+
+def approx_by_grb_lp_rounding(
+    t,
+    delta,
+    rc,
+    rounding_method,
+    seed,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    backend="GRB",
+    budget=None,
+):
     # initialize the candidate set as a singleton set with the emptyset as a trivial repair
     map = {t.get_empty_table().color_distribution: t.get_empty_table()}
-
-    m = gb.Model()
-    if seed is not None:
-        m.Params.Seed = seed
-    x = []
-
-    for i in range(t.df.shape[0]):
-        x.append(m.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS, name=f"r{i}"))
-
-    added = {}
-    edges = []
-    # construct the constraints for FDs
-    for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            for i in range(len(all_idxs)):
-                for j in range(i + 1, len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        for jj in all_idxs[j]:
-                            if (ii, jj) not in added and (jj, ii) not in added:
-                                m.addConstr(x[ii] + x[jj] <= 1)
-                                added[(ii, jj)] = 1
-                                edges.append([ii, jj])
-
-    # construct the constraints for RC
-    for color in range(t.color_distribution.c):
-        expr = gb.LinExpr()
-        for idx, _ in t.df[t.df[t.representative_column] == color].iterrows():
-            expr += x[idx]
-        expr -= gb.quicksum(x) * rc.constraint[t.labels[color]]
-        m.addLConstr(expr, GRB.GREATER_EQUAL, 0)
-
-    m.setObjective(gb.quicksum(x), GRB.MAXIMIZE)
-    m.Params.LogToConsole = 0
-    m.optimize()
-
-    assert m.status == GRB.OPTIMAL
-
+    with tracing.span("lp_relaxation"):
+        ct, graph, values = solve_lp_relaxation(
+            t, delta, rc, seed, fd_encoding, compress, backend, budget
+        )
+    # without any solution within the time limit, only the empty repair is left
+    if values is None:
+        return map
+    _t = ct.table if compress else t
+    w = ct.counts.tolist() if compress else [1] * t.df.shape[0]
+    # the (weighted) degree of a node in the conflict graph of the tuples
+    deg = graph.degrees(np.asarray(w, dtype=np.int64))
+
+    # the kept fraction of each tuple (class)
+    vals = (values / np.asarray(w)).tolist()
     idxs = []
 
     if rounding_method == "LP_ROUNDING":
         # random rounding (deprecated because it might introduce FD violations during rounding)
         r = np.random.RandomState(seed=global_random_seed)
-        for v in m.getVars():
-            if v.VarName != "ans" and r.rand() <= v.X:
-                idxs.append(int(v.VarName[1:]))
+        for i in range(len(vals)):
+            if r.rand() <= vals[i]:
+                idxs.append(i)
     elif rounding_method == "LP_GREEDY_ROUNDING":
         # greedyrounding
-        n_colors = t.color_distribution.c
-        ii = 0
-        nodes = [[], []]
-        for v in m.getVars():
-            if v.VarName != "ans":
-                if v.X == 1.0:
-                    idxs.append(int(v.VarName[1:]))
-                elif v.X > 0.0 and v.X < 1.0:
-                    nodes[ii].append([int(v.VarName[1:]), v.X])
-
-        adj = _compute_adj(edges)
-        while len(nodes[ii]) > 0:
-            id_to_pos = {}
-            for i in range(len(nodes[ii])):
-                id_to_pos[nodes[ii][i][0]] = i
-
-            pick = None
-            for i in range(len(nodes[ii])):
-                if pick is None or len(adj[nodes[ii][i][0]]) < len(adj[pick]):
-                    pick = nodes[ii][i][0]
-
-            nodes[ii][id_to_pos[pick]][1] = 1.0
-            for nxt in adj[pick]:
-                if nxt in id_to_pos:
-                    nodes[ii][id_to_pos[nxt]][1] = 0.0
-
-            nodes[1 - ii].clear()
-
-            for i in range(len(nodes[ii])):
-                if nodes[ii][i][1] < 1.0 and nodes[ii][i][1] > 0.0:
-                    nodes[1 - ii].append(copy.deepcopy(nodes[ii][i]))
-                elif nodes[ii][i][1] == 1.0:
-                    idxs.append(nodes[ii][i][0])
-            ii = 1 - ii
+        kept = np.asarray(vals)
+        idxs = np.flatnonzero(kept > 1 - eps).tolist()
+        adj = graph.csr()
+        fractional = _fractional_nodes(kept, idxs, adj)
+        tracing.count("lp_fractional_vars", fractional.shape[0])
+        with tracing.span("rounding"):
+            idxs += _greedy_rounding(fractional, deg, adj)
     elif rounding_method == "LP_NEW_GREEDY_ROUNDING":
         # repr rounding
-        n_colors = t.color_distribution.c
-        ii = 0
-        nodes = [[], []]
-        for v in m.getVars():
-            if v.VarName != "ans":
-                if v.X == 1.0:
-                    idxs.append(int(v.VarName[1:]))
-                elif v.X > 0.0 and v.X < 1.0:
-                    nodes[ii].append([int(v.VarName[1:]), v.X])
-
-        strata_to_cnt = {}
-        for color in range(t.color_distribution.c):
-            strata_to_cnt[color] = 0
-
-        adj = _compute_adj(edges)
-        while len(nodes[ii]) > 0:
-            id_to_pos = {}
-            for i in range(len(nodes[ii])):
-                id_to_pos[nodes[ii][i][0]] = i
-
-            pick = None
-            pick_color = None
-            for i in range(len(nodes[ii])):
-                x = nodes[ii][i][0]
-                x_color = t.df.loc[x, t.representative_column].item()
-                if pick is None:
-                    pick = x
-                    pick_color = x_color
-                else:
-                    x_color_constraint = rc.constraint[rc.labels[x_color]]
-                    pick_color_constraint = rc.constraint[rc.labels[pick_color]]
-                    x_ratio = strata_to_cnt[x_color] / x_color_constraint
-                    pick_ratio = strata_to_cnt[pick_color] / pick_color_constraint
-                    if (x_ratio, x_color_constraint, len(adj[x])) < (
-                        pick_ratio,
-                        pick_color_constraint,
-                        len(adj[pick]),
-                    ):
-                        pick = x
-                        pick_color = x_color
-
-            assert pick is not None
-            strata_to_cnt[pick_color] += 1
-
-            nodes[ii][id_to_pos[pick]][1] = 1.0
-            for nxt in adj[pick]:
-                if nxt in id_to_pos:
-                    nodes[ii][id_to_pos[nxt]][1] = 0.0
-
-            nodes[1 - ii].clear()
-
-            for i in range(len(nodes[ii])):
-                if nodes[ii][i][1] < 1.0 and nodes[ii][i][1] > 0.0:
-                    nodes[1 - ii].append(copy.deepcopy(nodes[ii][i]))
-                elif nodes[ii][i][1] == 1.0:
-                    idxs.append(nodes[ii][i][0])
-            ii = 1 - ii
-
-    # get the S-repair according to the value of each variable
-    t0 = Table(t.representative_column, t.df.iloc[idxs], t.labels)
+        kept = np.asarray(vals)
+        idxs = np.flatnonzero(kept > 1 - eps).tolist()
+        adj = graph.csr()
+        fractional = _fractional_nodes(kept, idxs, adj)
+        tracing.count("lp_fractional_vars", fractional.shape[0])
+        colors = _t.df[_t.representative_column].to_numpy(np.int64)
+        with tracing.span("rounding"):
+            idxs += _repr_rounding(
+                fractional, colors, w, deg, adj, rc, t.color_distribution.c
+            )
+
+    # get the S-repair according to the value of each variable (ct may be cached
+    # from an equal table, so the repair is a view of t rather than of ct.t)
+    if compress:
+        kept = np.zeros(len(w), dtype=np.int64)
+        kept[idxs] = ct.counts[idxs]
+        t0 = t.get_subtable_by_positions(ct.expand(kept))
+    else:
+        t0 = t.get_subtable_by_positions(idxs)
     map[t0.color_distribution] = t0
     return map
 
 
-def _compute_adj(edges):
-    adj = {}
-    for id in range(len(edges)):
-        if edges[id][0] not in adj:
-            adj[edges[id][0]] = []
-        if edges[id][1] not in adj:
-            adj[edges[id][1]] = []
-        adj[edges[id][0]].append(edges[id][1])
-        adj[edges[id][1]].append(edges[id][0])
-    return adj
+# the nodes with a fractional LP value that do not conflict with an integral node;
+# the LP values are only exact up to the tolerance of the backend, so a neighbour of
+# a kept node may come back slightly above 0
+def _fractional_nodes(kept, idxs, adj):
+    alive = (kept >= eps) & (kept <= 1 - eps)
+    alive[adj[idxs].indices] = False
+    return np.flatnonzero(alive)
+
+
+# round the fractional nodes greedily: repeatedly keep the alive node of minimum
+# degree (the smallest index among ties) and drop its neighbours; a heap with lazy
+# deletion replaces the rescan of all the alive nodes in every round
+# output: the kept nodes, in the order they are picked
+def _greedy_rounding(nodes, deg, adj):
+    alive = np.zeros(adj.shape[0], dtype=bool)
+    alive[nodes] = True
+    heap = [(deg[i], i) for i in nodes.tolist()]
+    heapq.heapify(heap)
+    picks = []
+    while len(heap) > 0:
+        _, pick = heapq.heappop(heap)
+        if not alive[pick]:
+            continue
+        picks.append(pick)
+        alive[pick] = False
+        alive[adj.indices[adj.indptr[pick] : adj.indptr[pick + 1]]] = False
+    return picks
+
+
+# round the fractional nodes by representation: repeatedly keep the alive node with
+# the smallest (kept count of its color / RC fraction of its color, RC fraction,
+# degree, index) and drop its neighbours; within a color only the degree and the
+# index differ, so one heap per color is enough and a round compares the heads
+# output: the kept nodes, in the order they are picked
+def _repr_rounding(nodes, colors, w, deg, adj, rc, n_colors):
+    alive = np.zeros(adj.shape[0], dtype=bool)
+    alive[nodes] = True
+    heaps = [[] for _ in range(n_colors)]
+    for i in nodes.tolist():
+        heaps[colors[i]].append((deg[i], i))
+    for heap in heaps:
+        heapq.heapify(heap)
+    constraint = [rc.constraint[rc.labels[color]] for color in range(n_colors)]
+    strata_to_cnt = [0] * n_colors
+    picks = []
+    while True:
+        pick_key, pick_color = None, None
+        for color in range(n_colors):
+            heap = heaps[color]
+            while len(heap) > 0 and not alive[heap[0][1]]:
+                heapq.heappop(heap)
+            if len(heap) == 0:
+                continue
+            # a color with RC fraction 0 is picked last
+            ratio = (
+                strata_to_cnt[color] / constraint[color]
+                if constraint[color] != 0
+                else float("inf")
+            )
+            key = (ratio, constraint[color]) + heap[0]
+            if pick_key is None or key < pick_key:
+                pick_key, pick_color = key, color
+        if pick_color is None:
+            return picks
+        _, pick = heapq.heappop(heaps[pick_color])
+        picks.append(pick)
+        strata_to_cnt[pick_color] += w[pick]
+        alive[pick] = False
+        alive[adj.indices[adj.indptr[pick] : adj.indptr[pick + 1]]] = False
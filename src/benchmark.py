@@ -0,0 +1,165 @@
+from driver import load_data, solve
+from synthetic import SHAPES, write_instance, parse_cardinality
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+from time import time
+import warnings
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+
+
+# the peak resident set size of this process (in MB; ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# run one solver on one instance in a fresh process, so that the peak memory of the
+# process is the one of this solver only, and send the measurements through conn
+def _run_solver(conn, files, res_dir, solver, options):
+    start_ts = time()
+    t, delta, rc = load_data(*files)
+    load_time = time() - start_ts
+    summary = solve(t, delta, rc, res_dir, solver=[solver], **options)[0]
+    conn.send(
+        {
+            "load_time": load_time,
+            "size": summary["size"],
+            "time": summary["time"],
+            "postclean_time": summary["postclean_time"],
+            "optimal": summary["optimal"],
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    )
+    conn.close()
+
+
+# output: the measurements of the solver, or a record with status "TIMEOUT" or
+#         "FAILED" if the process did not finish within timeout secs. or crashed
+def measure(files, res_dir, solver, options, timeout=None):
+    ctx = multiprocessing.get_context("spawn")
+    recv, send = ctx.Pipe(duplex=False)
+    p = ctx.Process(target=_run_solver, args=(send, files, res_dir, solver, options))
+    start_ts = time()
+    p.start()
+    send.close()
+    res = {"status": "FAILED"}
+    if recv.poll(timeout):
+        try:
+            res = dict(recv.recv(), status="OK")
+        except EOFError:
+            pass
+    else:
+        res = {"status": "TIMEOUT"}
+    if p.is_alive():
+        p.terminate()
+    p.join()
+    res["wall_time"] = time() - start_ts
+    return res
+
+
+# generate one synthetic instance per size and run every solver on it
+# output: one record per (size, solver), also written to benchmark.csv/.json
+def run_benchmark(
+    sizes,
+    solvers,
+    result_dir,
+    shape="chain",
+    noise=0.1,
+    timeout=None,
+    generator_options={},
+    **options,
+):
+    records = []
+    for n in sizes:
+        data_dir = os.path.join(result_dir, "data", shape, "")
+        files = write_instance(data_dir, n, shape, noise=noise, **generator_options)
+        res_dir = os.path.join(result_dir, shape, str(n), "")
+        os.makedirs(res_dir, exist_ok=True)
+        for solver in solvers:
+            res = measure(files, res_dir, solver, options, timeout)
+            record = dict(shape=shape, rows=n, noise=noise, solver=solver, **res)
+            print(json.dumps(record))
+            records.append(record)
+
+    with open(os.path.join(result_dir, "benchmark.json"), "w") as fout:
+        json.dump(records, fout, indent=1)
+    pd.DataFrame(records).to_csv(os.path.join(result_dir, "benchmark.csv"), index=False)
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--result_dir",
+        type=str,
+        default="../result/benchmark/",
+        help="the (related) output directory",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=str,
+        default="1000,2000,4000,8000",
+        help="comma-separated list of the numbers of rows",
+    )
+    parser.add_argument(
+        "--solvers",
+        type=str,
+        default="lhschain_dp,globalilp,lp_greedyrounding,lp_reprrounding,fdcleanser,vc_approx_baseline",
+        help="comma-separated list of solvers",
+    )
+    parser.add_argument(
+        "--shape", type=str, default="chain", choices=list(SHAPES.keys())
+    )
+    parser.add_argument(
+        "--cardinality",
+        type=str,
+        default=None,
+        help="(Optional) the cardinality of some columns, e.g., A=1000,B=100",
+    )
+    parser.add_argument("--noise", type=float, default=0.1, help="the noise rate")
+    parser.add_argument("--n_colors", type=int, default=2)
+    parser.add_argument("--skew", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="(Optional) kill a solver after TIMEOUT secs. (including the loading)",
+    )
+    parser.add_argument(
+        "--fd_encoding", type=str, default="pairwise", choices=["pairwise", "group"]
+    )
+    parser.add_argument("--compress", action="store_true", default=False)
+    parser.add_argument("--decompose", action="store_true", default=False)
+    parser.add_argument("--backend", type=str, default="grb", choices=["grb", "highs"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--time_limit", type=float, default=None)
+    parser.add_argument("--mip_gap", type=float, default=None)
+    args = parser.parse_args()
+
+    run_benchmark(
+        [int(n) for n in args.sizes.split(",")],
+        args.solvers.split(","),
+        args.result_dir,
+        shape=args.shape,
+        noise=args.noise,
+        timeout=args.timeout,
+        generator_options={
+            "cardinality": parse_cardinality(args.cardinality),
+            "n_colors": args.n_colors,
+            "skew": args.skew,
+            "seed": args.seed,
+        },
+        seed=args.seed,
+        fd_encoding=args.fd_encoding.upper(),
+        compress=args.compress,
+        decompose=args.decompose,
+        backend=args.backend.upper(),
+        threads=args.threads,
+        time_limit=args.time_limit,
+        mip_gap=args.mip_gap,
+    )
@@ -1,141 +1,141 @@
+import itertools
+import math
+import operator
 import numpy as np
 
 
 class ColorDistribution:
     # A class to maintain the distribution of sensitive values of the sensitive attribute
+    # It is immutable (a tuple of counts, one per color, with its hash computed once),
+    # so that it is cheap to build, hash and compare as a key of the frontiers; a
+    # batch of distributions is a 2-D array of counts (see as_array and the functions
+    # below)
+    __slots__ = ("c", "counts", "_hash")
+
     def __init__(self, c, d=None):
-        self.c = c
-        self.d = {}
-        for i in range(c):
-            self.d[i] = 0
+        counts = [0] * c
         if d is not None:
-            self.set(d)
+            for k in d:
+                counts[k] += int(d[k])
+        self._init(tuple(counts))
 
-    def sum(self):
-        _sum = 0
-        for i in range(self.c):
-            _sum += self.d[i]
-        return _sum
+    def _init(self, counts):
+        object.__setattr__(self, "c", len(counts))
+        object.__setattr__(self, "counts", counts)
+        object.__setattr__(self, "_hash", hash(counts))
 
-    def add_c(self, i):
-        self.d[i] += 1
+    # the distribution of a tuple of counts (without checking them)
+    @staticmethod
+    def from_counts(counts):
+        cd = object.__new__(ColorDistribution)
+        cd._init(tuple(counts))
+        return cd
 
-    def get_c(self, i):
-        return self.d[i]
+    def __setattr__(self, name, value):
+        raise AttributeError("ColorDistribution is immutable")
 
-    def set(self, d):
-        for k in d:
-            self.d[k] += d[k]
+    def __reduce__(self):
+        return ColorDistribution.from_counts, (self.counts,)
+
+    def sum(self):
+        return sum(self.counts)
+
+    def get_c(self, i):
+        return self.counts[i]
 
     def as_ordered_list(self):
-        return [(i, self.d[i]) for i in range(self.c)]
+        return list(enumerate(self.counts))
 
     def get_all_subdist(self):
-        _d = [[], [ColorDistribution(self.c)]]
-        ii = 0
-        for i in range(self.c):
-            for old_dist in _d[1 - ii]:
-                for k in range(self.d[i] + 1):
-                    _d[ii].append(old_dist + ColorDistribution(self.c, {i: k}))
-            _d[1 - ii].clear()
-            ii = 1 - ii
-        return _d[1 - ii]
+        return [
+            ColorDistribution.from_counts(counts)
+            for counts in itertools.product(*[range(k + 1) for k in self.counts])
+        ]
 
     def __add__(self, other):
         if isinstance(other, np.int64) or isinstance(other, int):
-            if isinstance(other, np.int64):
-                other = other.item()
-            res = {}
-            for i in range(self.c):
-                res[i] = self.d[i]
+            other = int(other)
+            res = list(self.counts)
             res[other] += 1
-            return ColorDistribution(self.c, res)
+            return ColorDistribution.from_counts(res)
         if not isinstance(other, ColorDistribution):
             raise TypeError("Unsupported operand type for +")
         if self.c != other.c:
             raise TypeError("Inequal dimension for +")
-        res = {}
-        for i in range(self.c):
-            res[i] = self.d[i] + other.d[i]
-        return ColorDistribution(self.c, res)
+        return ColorDistribution.from_counts(
+            map(operator.add, self.counts, other.counts)
+        )
 
     def __sub__(self, other):
         if not isinstance(other, ColorDistribution):
             raise TypeError("Unsupported operand type for -")
         if self.c != other.c:
             raise TypeError("Inequal dimension for -")
-        res = {}
-        for i in range(self.c):
-            if self.d[i] < other.d[i]:
-                raise ValueError("Value out-of-bound for -")
-            res[i] = self.d[i] - other.d[i]
-        return ColorDistribution(self.c, res)
-
-    def __iadd__(self, other):
-        if not isinstance(other, ColorDistribution):
-            raise TypeError("Unsupported operand type for +")
-        if self.c != other.c:
-            raise TypeError("Inequal dimension for +")
-        for i in range(self.c):
-            self.d[i] += other.d[i]
-        return self
-
-    def __isub__(self, other):
-        if not isinstance(other, ColorDistribution):
-            raise TypeError("Unsupported operand type for -")
-        if self.c != other.c:
-            raise TypeError("Inequal dimension for -")
-        for i in range(self.c):
-            if self.d[i] < other.d[i]:
-                raise ValueError("Value out-of-bound for -")
-            self.d[i] -= other.d[i]
-        return self
+        res = tuple(x - y for x, y in zip(self.counts, other.counts))
+        if min(res, default=0) < 0:
+            raise ValueError("Value out-of-bound for -")
+        return ColorDistribution.from_counts(res)
 
     def __hash__(self):
-        return hash(tuple(self.as_ordered_list()))
+        return self._hash
 
     def __eq__(self, other):
         if not isinstance(other, ColorDistribution):
             return False
-        if self.c != other.c:
-            return False
-        for i in range(self.c):
-            if self.d[i] != other.d[i]:
-                return False
-        return True
+        return self._hash == other._hash and self.counts == other.counts
 
     def __lt__(self, other):
         if not isinstance(other, ColorDistribution):
             raise TypeError("Unsupported operand type for <")
         if self.c != other.c:
             raise ValueError("Inequal dimension for <")
-        flag = False
-        for i in range(self.c):
-            if self.d[i] > other.d[i]:
-                return False
-            if self.d[i] < other.d[i]:
-                flag = True
-        return flag
+        return self.counts != other.counts and all(
+            map(operator.le, self.counts, other.counts)
+        )
 
     def better_than(self, other, rc, labels):
-        if other < self:
-            return True
-        min0 = None
-        min1 = None
-        for i in range(self.c):
-            if rc.constraint[labels[i]] == 0:
-                continue
-            times0 = self.d[i] / rc.constraint[labels[i]]
-            if min0 is None or min0 > times0:
-                min0 = times0
-            times1 = other.d[i] / rc.constraint[labels[i]]
-            if min1 is None or min1 > times1:
-                min1 = times1
-        if min0 is None and min1 is None:
-            return self.sum() > other.sum()
-        if min0 == min1:
-            return self.sum() > other.sum()
-        return min0 > min1
+        return bool(
+            better_than(
+                as_array([self], self.c), as_array([other], other.c), rc, labels
+            )[0]
+        )
 
     def __str__(self):
-        return ",".join([f"({i},{self.d[i]})" for i in range(self.c)])
+        return ",".join([f"({i},{k})" for i, k in enumerate(self.counts)])
+
+
+# the counts of a list of ColorDistributions, one row each
+def as_array(cds, c):
+    return np.array([cd.counts for cd in cds], dtype=np.int64).reshape(-1, c)
+
+
+# the ColorDistributions of the rows of an array of counts
+def from_array(counts):
+    return [ColorDistribution.from_counts(row) for row in counts.tolist()]
+
+
+# whether each row of counts0 dominates (> in a color, >= in all) that of counts1
+def dominates(counts0, counts1):
+    return (counts0 >= counts1).all(axis=-1) & (counts0 > counts1).any(axis=-1)
+
+
+# whether each row of counts0 is better than that of counts1 under the RC: it
+# dominates it, or it allows a larger RS-repair (the least count / fraction among
+# the colors with a positive fraction), or as large a one and has more tuples
+def better_than(counts0, counts1, rc, labels):
+    c = counts0.shape[-1]
+    fractions = [rc.constraint[labels[i]] for i in range(c)]
+    positive = np.array([f != 0 for f in fractions], dtype=bool)
+    larger = counts0.sum(axis=-1) > counts1.sum(axis=-1)
+    if not positive.any():
+        return dominates(counts0, counts1) | larger
+    # count / fraction, scaled by the lcm of the numerators to compare integers
+    lcm = math.lcm(*[f.numerator for f in fractions if f != 0])
+    scales = [f.denominator * (lcm // f.numerator) for f in fractions if f != 0]
+    dtype = np.int64 if max(scales) < (1 << 31) else object
+    scales = np.array(scales, dtype=dtype)
+    times0 = (counts0[..., positive].astype(dtype) * scales).min(axis=-1)
+    times1 = (counts1[..., positive].astype(dtype) * scales).min(axis=-1)
+    return dominates(counts0, counts1) | np.where(
+        times0 == times1, larger, times0 > times1
+    )
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+# Tuples that agree on every column of the FDs and on the representative column
+# are interchangeable: they conflict with exactly the same tuples. A
+# CompressedTable keeps one tuple per such class (in the order of their first
+# appearance) together with the size of the class, so that a solver can work
+# with one (integer) variable per class and map its solution back to tuples.
+class CompressedTable:
+    def __init__(self, t, delta):
+        self.t = t
+        cols = sorted(delta.get_all_cols())
+        if t.representative_column is not None and t.representative_column not in cols:
+            cols.append(t.representative_column)
+        if t.nrows() == 0 or len(cols) == 0:
+            self.classes = np.zeros(t.nrows(), dtype=np.int64)
+        else:
+            self.classes = t.df.groupby(cols, sort=False).ngroup().to_numpy(np.int64)
+        _, first, counts = np.unique(
+            self.classes, return_index=True, return_counts=True
+        )
+        self.counts = counts
+        self.table = t.get_subtable_by_positions(first)
+
+    def nclasses(self):
+        return self.counts.shape[0]
+
+    # input: the number of tuples to keep for each class
+    # output: the positions (in the original table) of the kept tuples, i.e., the
+    # first kept[c] tuples of each class c, in their original order
+    def expand(self, kept):
+        kept = np.minimum(np.asarray(kept, dtype=np.int64), self.counts)
+        order = np.argsort(self.classes, kind="stable")
+        starts = np.cumsum(self.counts) - self.counts
+        rank = np.arange(order.shape[0]) - starts[self.classes[order]]
+        return np.sort(order[rank < kept[self.classes[order]]])
+
+    def get_subtable_by_kept(self, kept):
+        return self.t.get_subtable_by_positions(self.expand(kept))
@@ -2,6 +2,7 @@ import sys
 
 sys.path.append("./src")
 from functional_dependency import FD, LHS, RHS, FDSet
+from conflict_graph import build_conflict_graph
 import numpy as np
 import random
 
@@ -42,39 +43,11 @@ def make_col_string(df, *args):
 
 
 def compute_pairwise_violations(df, delta):
-    cnt = 0
-    added = {}
-    for fd in delta.fds:
-        lhs_grouped = df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            for i in range(len(all_idxs)):
-                for j in range(i + 1, len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        for jj in all_idxs[j]:
-                            if (ii, jj) not in added:
-                                cnt += 1
-                                added[(ii, jj)] = 1
-    return cnt
+    return build_conflict_graph(df, delta).nedges()
 
 
 def compute_violated_tuples(df, delta):
-    idx_to_is_violated = {}
-    for fd in delta.fds:
-        lhs_grouped = df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            if len(all_idxs) > 1:
-                for i in range(len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        idx_to_is_violated[ii] = True
-    return len(idx_to_is_violated)
+    return build_conflict_graph(df, delta).violated_nodes().shape[0]
 
 
 def compute_total_pairs(df):
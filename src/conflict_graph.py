@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+import tracing
+
+
+# The conflict graph of a relation w.r.t. a FDSet: one node per tuple (by its
+# position in the dataframe) and one edge per pair of tuples that violates at
+# least one FD. Edges are kept as a (m, 2) int64 array in the order they are
+# first found, i.e., FD by FD, LHS group by LHS group (sorted), RHS value pair by
+# RHS value pair (sorted), which is the order of the old nested-loop enumeration.
+class ConflictGraph:
+    def __init__(self, n, edges=None):
+        self.n = n
+        if edges is None:
+            edges = np.empty((0, 2), dtype=np.int64)
+        self.edges = edges
+
+    def nedges(self):
+        return self.edges.shape[0]
+
+    # COO form: the two endpoints of each edge
+    def coo(self):
+        return self.edges[:, 0], self.edges[:, 1]
+
+    # CSR form of the (symmetric) adjacency matrix
+    def csr(self):
+        rows = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        cols = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        data = np.ones(rows.shape[0], dtype=np.int8)
+        return csr_matrix((data, (rows, cols)), shape=(self.n, self.n))
+
+    # the number of neighbours of each node, or the sum of their weights
+    def degrees(self, weights=None):
+        if weights is None:
+            return np.bincount(self.edges.ravel(), minlength=self.n)
+        u, v = self.coo()
+        deg = np.bincount(
+            np.r_[u, v], weights=np.r_[weights[v], weights[u]], minlength=self.n
+        )
+        return deg.astype(weights.dtype)
+
+    # the tuples involved in at least one violation
+    def violated_nodes(self):
+        return np.flatnonzero(self.degrees())
+
+    # the subgraph induced by the (sorted) nodes, renumbered in their order
+    def subgraph(self, nodes):
+        pos = np.full(self.n, -1, dtype=np.int64)
+        pos[nodes] = np.arange(nodes.shape[0])
+        edges = pos[self.edges]
+        return ConflictGraph(nodes.shape[0], edges[(edges >= 0).all(axis=1)])
+
+    # edge list as a list of [u, v]
+    def edge_list(self):
+        return self.edges.tolist()
+
+
+# factorize a FD over a dataframe
+# output: (lhs_codes, rhs_codes), where the codes follow the sorted order of values
+def factorize_fd(df, fd):
+    n = df.shape[0]
+    if len(fd.lhs.cols) == 0:
+        lhs_codes = np.zeros(n, dtype=np.int64)
+    elif len(fd.lhs.cols) == 1:
+        lhs_codes = pd.factorize(df[fd.lhs.cols[0]], sort=True)[0].astype(np.int64)
+    else:
+        lhs_codes = df.groupby(fd.lhs.cols, sort=True).ngroup().to_numpy(np.int64)
+    rhs_codes = pd.factorize(df[fd.rhs.col], sort=True)[0].astype(np.int64)
+    return lhs_codes, rhs_codes
+
+
+# all the violating pairs of a single FD, as (positions of u, positions of v)
+def _fd_conflicts(lhs_codes, rhs_codes):
+    n = lhs_codes.shape[0]
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.lexsort((rhs_codes, lhs_codes))
+    l, r = lhs_codes[order], rhs_codes[order]
+
+    # boundaries of the LHS groups and of the (LHS, RHS) blocks in sorted order
+    new_group = np.r_[True, l[1:] != l[:-1]]
+    new_block = new_group | np.r_[True, r[1:] != r[:-1]]
+    group_id = np.cumsum(new_group) - 1
+    block_id = np.cumsum(new_block) - 1
+    group_end = np.r_[np.flatnonzero(new_group)[1:], n][group_id]
+    block_end = np.r_[np.flatnonzero(new_block)[1:], n][block_id]
+
+    # each tuple conflicts with every tuple after its block within its group
+    cnt = group_end - block_end
+    total = int(cnt.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pos_u = np.repeat(np.arange(n), cnt)
+    offsets = np.arange(total) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+    pos_v = block_end[pos_u] + offsets
+
+    # enumerate by (block of u, block of v, u, v) as the nested loops did
+    perm = np.lexsort((pos_v, pos_u, block_id[pos_v], block_id[pos_u]))
+    return order[pos_u[perm]], order[pos_v[perm]]
+
+
+# input: a dataframe df, a FDSet delta
+# output: the ConflictGraph of df w.r.t. delta (edges deduplicated across FDs)
+def build_conflict_graph(df, delta):
+    with tracing.span("conflict_graph"):
+        graph = _build_conflict_graph(df, delta)
+    tracing.count("conflict_edges", graph.nedges())
+    return graph
+
+
+def _build_conflict_graph(df, delta):
+    n = df.shape[0]
+    us, vs = [], []
+    for fd in delta.fds:
+        u, v = _fd_conflicts(*factorize_fd(df, fd))
+        us.append(u)
+        vs.append(v)
+    if len(us) == 0:
+        return ConflictGraph(n)
+    u, v = np.concatenate(us), np.concatenate(vs)
+    # keep the first occurrence of each (unordered) pair
+    key = np.minimum(u, v) * n + np.maximum(u, v)
+    _, first = np.unique(key, return_index=True)
+    first.sort()
+    return ConflictGraph(n, np.stack([u[first], v[first]], axis=1))
+
+
+# the (LHS group, RHS value) blocks of the FDs, restricted to the LHS groups that
+# hold more than one RHS value (the only groups that can be violated)
+# output: (rows, blocks, block_groups), where rows[k] is a tuple that lies in the
+# block blocks[k], and block_groups[b] is the LHS group of block b; blocks and
+# groups are numbered consecutively across all FDs
+def build_fd_blocks(df, delta):
+    all_rows, all_blocks, all_block_groups = [], [], []
+    nblocks, ngroups = 0, 0
+    for fd in delta.fds:
+        lhs_codes, rhs_codes = factorize_fd(df, fd)
+        if lhs_codes.shape[0] == 0:
+            continue
+        block_codes, block_idxs = np.unique(
+            np.stack([lhs_codes, rhs_codes], axis=1), axis=0, return_inverse=True
+        )
+        block_idxs = block_idxs.ravel()
+        # number of RHS values per LHS group
+        group_size = np.bincount(block_codes[:, 0])
+        conflicting = group_size[block_codes[:, 0]] > 1
+        if not conflicting.any():
+            continue
+        kept_blocks = np.flatnonzero(conflicting)
+        block_to_new = np.full(block_codes.shape[0], -1, dtype=np.int64)
+        block_to_new[kept_blocks] = np.arange(kept_blocks.shape[0]) + nblocks
+        _, groups = np.unique(block_codes[kept_blocks, 0], return_inverse=True)
+
+        rows = np.flatnonzero(conflicting[block_idxs])
+        all_rows.append(rows)
+        all_blocks.append(block_to_new[block_idxs[rows]])
+        all_block_groups.append(groups.ravel() + ngroups)
+        nblocks += kept_blocks.shape[0]
+        ngroups += int(groups.max()) + 1
+    if len(all_rows) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    return (
+        np.concatenate(all_rows),
+        np.concatenate(all_blocks),
+        np.concatenate(all_block_groups),
+    )
@@ -13,7 +13,14 @@ from time import time
 import numpy as np
 from utility import sanity_check, compute_pairwise_violations, compute_violated_tuples
 import warnings
-from postclean import postclean_for_set
+from postclean import postclean_for_set, RCBound
+from linear_model import SolverBudget
+import tracing
+import cProfile
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
 
 warnings.filterwarnings("ignore")
 
@@ -21,61 +28,236 @@ import argparse
 
 
 def load_data(table_filename, fds_filename, rc_filename):
-    representative_column, rc = load_representative_constraint(rc_filename)
-    t = Table(
-        representative_column, filename=table_filename, delimeter=",", dropna=False
-    )
+    with tracing.span("load_rc"):
+        representative_column, rc = load_representative_constraint(rc_filename)
+    with tracing.span("load_relation"):
+        t = Table(
+            representative_column, filename=table_filename, delimeter=",", dropna=False
+        )
     rc.set_labels(t.labels)
-    delta = load_fdset(fds_filename, t)
+    with tracing.span("load_fdset"):
+        delta = load_fdset(fds_filename, t)
     for col in delta.get_all_cols():
         if t.missing_cnt[col] > 0:
             raise ValueError(f"Missing values in column: {col}")
     return t, delta, rc
 
 
-def solve(t, delta, rc, res_dir, solver=[], seed=None, report_violation=False):
+# run the given heuristics and PostClean their results, to warm-start globalilp
+# output: a list of RS-repairs
+def warm_start_repairs(
+    t,
+    delta,
+    rc,
+    heuristics,
+    seed=None,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    backend="GRB",
+    budget=None,
+):
+    starts = []
+    for func_name in heuristics:
+        match func_name:
+            case "lp_greedyrounding" | "lp_reprrounding":
+                repairs = approx(
+                    t,
+                    delta,
+                    rc,
+                    (
+                        "GRB_LP_GREEDY_ROUNDING"
+                        if func_name == "lp_greedyrounding"
+                        else "GRB_LP_NEW_GREEDY_ROUNDING"
+                    ),
+                    seed=seed,
+                    fd_encoding=fd_encoding,
+                    compress=compress,
+                    backend=backend,
+                    budget=budget,
+                )
+            case "fdcleanser":
+                repairs = s_repair(
+                    t,
+                    delta,
+                    rc,
+                    AfterReduction.MOST_FREQUENT_COL,
+                    seed=seed,
+                    backend=backend,
+                    budget=budget,
+                )
+            case "vc_approx_baseline":
+                srepair = s_repair_wo_rc(
+                    t,
+                    delta,
+                    AfterReduction_wo_rc.APPROX,
+                    seed=seed,
+                    compress=compress,
+                )
+                repairs = {srepair.color_distribution: srepair}
+            case default:
+                raise ValueError("Unsupported Heuristic for Warm Start")
+        starts.append(postclean_for_set(repairs, rc))
+    return starts
+
+
+def solve(
+    t,
+    delta,
+    rc,
+    res_dir,
+    solver=[],
+    seed=None,
+    report_violation=False,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    decompose=False,
+    backend="GRB",
+    threads=None,
+    time_limit=None,
+    mip_gap=None,
+    warm_start=[],
+    profile=False,
+    partition_jobs=None,
+):
+    # a summary of each solver (size, timings, distribution) for the callers
+    summaries = []
     for func_name in solver:
         with open(res_dir + func_name + ".txt", "w") as fout:
-            start_ts = time()
-            repairs, optimal_srepair = None, None
-            match func_name:
-                case "lhschain_dp":
-                    repairs = s_repair(
-                        t, delta, rc, matching_method="GRB_ILP", seed=seed
-                    )
-                case "globalilp":
-                    repairs = exact(t, delta, rc, seed=seed)
-                case "lp_greedyrounding":
-                    repairs = approx(t, delta, rc, "GRB_LP_GREEDY_ROUNDING", seed=seed)
-                case "lp_reprrounding":
-                    repairs = approx(
-                        t, delta, rc, "GRB_LP_NEW_GREEDY_ROUNDING", seed=seed
-                    )
-                case "fdcleanser":
-                    repairs = s_repair(
-                        t, delta, rc, AfterReduction.MOST_FREQUENT_COL, seed=seed
-                    )
-                case "dp_baseline":
-                    optimal_srepair = s_repair_wo_rc(
-                        t, delta, AfterReduction_wo_rc.ERROR, seed=seed
-                    )
-                    repairs = {optimal_srepair.color_distribution: optimal_srepair}
-                case "vc_approx_baseline":
-                    optimal_srepair = s_repair_wo_rc(
-                        t, delta, AfterReduction_wo_rc.APPROX, seed=seed
-                    )
-                    repairs = {optimal_srepair.color_distribution: optimal_srepair}
-                case "ilp_baseline":
-                    optimal_srepair = exact_by_grb_ilp_wo_rc(t, delta, seed=seed)
-                    repairs = {optimal_srepair.color_distribution: optimal_srepair}
-                case default:
-                    raise ValueError("Unsupported Solver")
-            postclean_ts = time()
-            optimal = postclean_for_set(repairs, rc)
-            end_ts = time()
-            assert sanity_check(optimal, delta, rc)
-            fout.write(f"Overall Time cost(in secs.): {end_ts - start_ts}\n")
+            # the phases and counters of the solver go to {solver}_trace.json, and
+            # with profile, its cProfile statistics to {solver}.prof
+            tracer = tracing.start()
+            profiler = cProfile.Profile() if profile else None
+            if profiler is not None:
+                profiler.enable()
+            with tracing.span("solve"):
+                start_ts = time()
+                # the time limit is shared by all the (I)LPs solved by this solver
+                budget = SolverBudget(threads, time_limit, mip_gap)
+                repairs, optimal_srepair = None, None
+                match func_name:
+                    case "lhschain_dp":
+                        repairs = s_repair(
+                            t,
+                            delta,
+                            rc,
+                            matching_method="GRB_ILP",
+                            seed=seed,
+                            backend=backend,
+                            budget=budget,
+                            bound=RCBound(rc),
+                            jobs=partition_jobs,
+                        )
+                    case "globalilp":
+                        # HiGHS takes no MIP starts, so the heuristics would only
+                        # spend the time (and the time limit) of globalilp
+                        starts = (
+                            warm_start_repairs(
+                                t,
+                                delta,
+                                rc,
+                                warm_start,
+                                seed=seed,
+                                fd_encoding=fd_encoding,
+                                compress=compress,
+                                backend=backend,
+                                budget=budget,
+                            )
+                            if backend == "GRB"
+                            else []
+                        )
+                        repairs = exact(
+                            t,
+                            delta,
+                            rc,
+                            seed=seed,
+                            fd_encoding=fd_encoding,
+                            compress=compress,
+                            decompose=decompose,
+                            backend=backend,
+                            budget=budget,
+                            starts=starts,
+                        )
+                    case "lp_greedyrounding":
+                        repairs = approx(
+                            t,
+                            delta,
+                            rc,
+                            "GRB_LP_GREEDY_ROUNDING",
+                            seed=seed,
+                            fd_encoding=fd_encoding,
+                            compress=compress,
+                            backend=backend,
+                            budget=budget,
+                        )
+                    case "lp_reprrounding":
+                        repairs = approx(
+                            t,
+                            delta,
+                            rc,
+                            "GRB_LP_NEW_GREEDY_ROUNDING",
+                            seed=seed,
+                            fd_encoding=fd_encoding,
+                            compress=compress,
+                            backend=backend,
+                            budget=budget,
+                        )
+                    case "fdcleanser":
+                        repairs = s_repair(
+                            t,
+                            delta,
+                            rc,
+                            AfterReduction.MOST_FREQUENT_COL,
+                            seed=seed,
+                            backend=backend,
+                            budget=budget,
+                            jobs=partition_jobs,
+                        )
+                    case "dp_baseline":
+                        optimal_srepair = s_repair_wo_rc(
+                            t,
+                            delta,
+                            AfterReduction_wo_rc.ERROR,
+                            seed=seed,
+                            jobs=partition_jobs,
+                        )
+                        repairs = {optimal_srepair.color_distribution: optimal_srepair}
+                    case "vc_approx_baseline":
+                        optimal_srepair = s_repair_wo_rc(
+                            t,
+                            delta,
+                            AfterReduction_wo_rc.APPROX,
+                            seed=seed,
+                            compress=compress,
+                            jobs=partition_jobs,
+                        )
+                        repairs = {optimal_srepair.color_distribution: optimal_srepair}
+                    case "ilp_baseline":
+                        optimal_srepair = exact_by_grb_ilp_wo_rc(
+                            t,
+                            delta,
+                            seed=seed,
+                            compress=compress,
+                            backend=backend,
+                            budget=budget,
+                        )
+                        repairs = {optimal_srepair.color_distribution: optimal_srepair}
+                    case default:
+                        raise ValueError("Unsupported Solver")
+                postclean_ts = time()
+                with tracing.span("postclean"):
+                    optimal = postclean_for_set(repairs, rc)
+                end_ts = time()
+                # with the work reused from an earlier solver (the cached LP)
+                elapsed = end_ts - start_ts + budget.reused_time
+            with tracing.span("sanity_check"):
+                assert sanity_check(optimal, delta, rc)
+            fout.write(f"Overall Time cost(in secs.): {elapsed}\n")
             fout.write(f"Size of RS-repair: {optimal.nrows()}\n")
+            # the solves stopped by the time limit (or the MIP gap) before optimality
+            for report in budget.non_optimal_reports():
+                fout.write(
+                    f"Solver status ({report['backend']}): {report['status']}, incumbent: {report['objective']}, bound: {report['bound']}, gap: {report['gap']}\n"
+                )
             if report_violation:
                 fout.write(
                     f"Pairwise Violation Ratio: {np.round(100. * compute_pairwise_violations(optimal, delta) / optimal.npairs(), 3) if optimal.nrows() > 0 else 0}%\n"
@@ -87,9 +269,23 @@ def solve(t, delta, rc, res_dir, solver=[], seed=None, report_violation=False):
                 f"Distribution of Representative Column : {optimal.get_representative_column_distribution()}\n"
             )
             fout.write(f"Time cost of PostClean(in secs.): {end_ts - postclean_ts}\n")
-            fout.write(str(optimal) + "\n")
+            with tracing.span("table_repr"):
+                fout.write(str(optimal) + "\n")
             print(
-                f"[{np.round(end_ts - start_ts, 3)}s] Size of RS-repair({func_name}): {optimal.nrows()}"
+                f"[{np.round(elapsed, 3)}s] Size of RS-repair({func_name}): {optimal.nrows()}"
+            )
+            summaries.append(
+                {
+                    "solver": func_name,
+                    "size": optimal.nrows(),
+                    "time": elapsed,
+                    "postclean_time": end_ts - postclean_ts,
+                    "distribution": {
+                        str(k): int(v)
+                        for k, v in optimal.get_representative_column_distribution().items()
+                    },
+                    "optimal": len(budget.non_optimal_reports()) == 0,
+                }
             )
             if optimal_srepair is not None:
                 with open(
@@ -99,6 +295,85 @@ def solve(t, delta, rc, res_dir, solver=[], seed=None, report_violation=False):
                         f"Distribution of Representative Column : {optimal_srepair.get_representative_column_distribution()}\n"
                     )
                     fbackup.write(str(optimal_srepair) + "\n")
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(res_dir + func_name + ".prof")
+            tracing.stop()
+            tracer.dump(res_dir + func_name + "_trace.json")
+    return summaries
+
+
+# the (table, FD set, RC) of a worker process, and the shared memory block its
+# relation is a view of (open as long as the worker)
+_shared_instance = None
+_shared_block = None
+
+
+# instance: the rest of the (table, FD set, RC), see solve_in_parallel
+def _init_worker(shm_name, instance):
+    global _shared_instance, _shared_block
+    warnings.filterwarnings("ignore")
+    representative_column, labels, dicts, columns, dtype, n, delta, rc = instance
+    _shared_block = SharedMemory(name=shm_name)
+    codes = np.ndarray((len(columns), n), dtype=dtype, buffer=_shared_block.buf)
+    # the workers share the codes, so none of them may write to them
+    codes.flags.writeable = False
+    # a DataFrame of one 2-D block wraps the array without copying it
+    df = pd.DataFrame(codes.T, columns=columns, copy=False)
+    t = Table(representative_column, df, labels, dicts=dicts)
+    _shared_instance = (t, delta, rc)
+
+
+def _solve_in_worker(res_dir, single_solver, kwargs):
+    t, delta, rc = _shared_instance
+    solve(t, delta, rc, res_dir, solver=[single_solver], **kwargs)
+    return single_solver
+
+
+# run the solvers concurrently in a pool of jobs processes; the dictionary-encoded
+# relation is written once into a shared memory block, as one array of codes (a row
+# per column), which every worker wraps into its Table without copying it (only the
+# labels, dictionaries, FD set and RC are pickled to each worker), and each solver
+# times itself in its worker
+# threads: the threads of each solver, by default an equal share of the cores
+def solve_in_parallel(t, delta, rc, res_dir, solvers, jobs, threads=None, **kwargs):
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+    # the tuples of t (a view of its base) as a relation of their own
+    base = t.df
+    dtype = np.result_type(*base.dtypes)
+    shm = SharedMemory(create=True, size=max(1, base.size * dtype.itemsize))
+    try:
+        codes = np.ndarray((base.shape[1], base.shape[0]), dtype=dtype, buffer=shm.buf)
+        codes[:] = base.to_numpy(dtype=dtype).T
+        instance = (
+            t.representative_column,
+            t.labels,
+            t.dicts,
+            list(base.columns),
+            dtype,
+            base.shape[0],
+            delta,
+            rc,
+        )
+        del codes
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(shm.name, instance)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _solve_in_worker,
+                    res_dir,
+                    single_solver,
+                    dict(kwargs, threads=threads),
+                )
+                for single_solver in solvers
+            ]
+            for future in as_completed(futures):
+                print("Finished:", future.result())
+    finally:
+        shm.close()
+        shm.unlink()
 
 
 if __name__ == "__main__":
@@ -142,6 +417,74 @@ if __name__ == "__main__":
     parser.add_argument(
         "--seed", type=int, default=42, help="(Optional) the random seed"
     )
+    parser.add_argument(
+        "--fd_encoding",
+        type=str,
+        default="pairwise",
+        choices=["pairwise", "group"],
+        help="(Optional) how globalilp and the LP roundings encode the FDs: one constraint per conflicting pair (pairwise), or one selector per (LHS group, RHS value) (group)",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        default=False,
+        help="(Optional) merge the tuples that are identical on the FD attributes and the representative column into one weighted variable (globalilp, lp_greedyrounding, lp_reprrounding, ilp_baseline, vc_approx_baseline)",
+    )
+    parser.add_argument(
+        "--decompose",
+        action="store_true",
+        default=False,
+        help="(Optional) solve globalilp per connected component of the conflict graph into frontiers of color distributions, with a single ILP only for the components too large to enumerate",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="grb",
+        choices=["grb", "highs"],
+        help="(Optional) the solver for the ILPs/LPs: Gurobi (grb), or the open-source HiGHS through scipy (highs), which needs no license",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="(Optional) the number of threads of the solver (default: 30 for globalilp and ilp_baseline, the solver's choice otherwise)",
+    )
+    parser.add_argument(
+        "--time_limit",
+        type=float,
+        default=None,
+        help="(Optional) the wall-clock limit (in secs.) of the ILPs/LPs of each solver; when it hits, the best solution found so far is used",
+    )
+    parser.add_argument(
+        "--mip_gap",
+        type=float,
+        default=None,
+        help="(Optional) stop an ILP once its relative gap to the bound is at most MIP_GAP",
+    )
+    parser.add_argument(
+        "--warm_start",
+        type=str,
+        default="",
+        help="(Optional) comma-separated list of heuristics, [lp_greedyrounding,lp_reprrounding,fdcleanser,vc_approx_baseline], whose RS-repairs are given to globalilp as MIP starts (Gurobi only)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="(Optional) the number of solvers to run concurrently (in separate processes); each one gets an equal share of the cores unless --threads is given",
+    )
+    parser.add_argument(
+        "--partition_jobs",
+        type=int,
+        default=None,
+        help="(Optional) the number of processes that repair the independent partitions (of a common-LHS or consensus column) of lhschain_dp, fdcleanser, dp_baseline and vc_approx_baseline",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="(Optional) dump the cProfile statistics of each solver to {solver}.prof in the result directory",
+    )
     args = parser.parse_args()
     dir = args.input_dir
     res_dir = args.result_dir
@@ -151,8 +494,45 @@ if __name__ == "__main__":
     solvers = args.solvers.split(",")
     report_violation = args.report_violation
     seed = args.seed
+    fd_encoding = args.fd_encoding.upper()
+    compress = args.compress
+    decompose = args.decompose
+    backend = args.backend.upper()
+    threads = args.threads
+    time_limit = args.time_limit
+    mip_gap = args.mip_gap
+    warm_start = [h for h in args.warm_start.split(",") if h != ""]
+    jobs = args.jobs
+    profile = args.profile
+    partition_jobs = args.partition_jobs
 
+    loader = tracing.start()
     t, delta, rc = load_data(t_filename, fds_filename, rc_filename)
+    tracing.stop()
+    loader.dump(res_dir + "load_trace.json")
+
+    if jobs > 1:
+        solve_in_parallel(
+            t,
+            delta,
+            rc,
+            res_dir,
+            solvers,
+            jobs,
+            threads=threads,
+            seed=seed,
+            report_violation=report_violation,
+            fd_encoding=fd_encoding,
+            compress=compress,
+            decompose=decompose,
+            backend=backend,
+            time_limit=time_limit,
+            mip_gap=mip_gap,
+            warm_start=warm_start,
+            profile=profile,
+            partition_jobs=partition_jobs,
+        )
+        exit(0)
 
     for single_solver in solvers:
         print("Working on solver:", single_solver)
@@ -164,5 +544,15 @@ if __name__ == "__main__":
             solver=[single_solver],
             seed=seed,
             report_violation=report_violation,
+            fd_encoding=fd_encoding,
+            compress=compress,
+            decompose=decompose,
+            backend=backend,
+            threads=threads,
+            time_limit=time_limit,
+            mip_gap=mip_gap,
+            warm_start=warm_start,
+            profile=profile,
+            partition_jobs=partition_jobs,
         )
         print("Finished!")
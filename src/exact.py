@@ -1,112 +1,500 @@
-import gurobipy as gb
-from gurobipy import GRB
-from table import Table
+from linear_model import LinearModel, solve
+from conflict_graph import build_conflict_graph, build_fd_blocks
+from compression import CompressedTable
+import networkx as nx
+import numpy as np
+from scipy.sparse.csgraph import connected_components
 from tqdm import tqdm
+import tracing
+from frontier import ParetoFrontier
+from color_distribution import as_array
 
 
-def exact(t, delta, rc, method="GRB_ILP", seed=None):
+def exact(
+    t,
+    delta,
+    rc,
+    method="GRB_ILP",
+    seed=None,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    decompose=False,
+    backend="GRB",
+    budget=None,
+    starts=None,
+):
     if method == "GRB_ILP":
-        return exact_by_grb_ilp(t, delta, rc, seed)
+        return exact_by_grb_ilp(
+            t,
+            delta,
+            rc,
+            seed,
+            fd_encoding=fd_encoding,
+            compress=compress,
+            decompose=decompose,
+            backend=backend,
+            budget=budget,
+            starts=starts,
+        )
     raise ValueError("Not Supported Optimizer")
 
 
+# add the tuple variables x, one per row of t (binary), or one per class of tuples
+# (integer, bounded by counts[i], the size of the class)
+# output: (x, s), the indices of the variables; s are the ones to put in the
+# constraints for FDs, i.e., x itself for singleton classes and a binary selector
+# s >= x / count otherwise
+def add_tuple_vars(model, n, counts=None, integer=True):
+    if counts is None:
+        x = model.add_vars(n, integer=integer)
+        return x, x
+    x = model.add_vars(n, ub=counts, integer=integer)
+    multi = np.flatnonzero(counts > 1)
+    s = x.copy()
+    s[multi] = model.add_vars(multi.shape[0], integer=integer)
+    # x <= count * s
+    k = multi.shape[0]
+    model.add_constrs(
+        k,
+        np.r_[np.arange(k), np.arange(k)],
+        np.r_[x[multi], s[multi]],
+        np.r_[np.ones(k), -counts[multi]],
+        hi=0,
+    )
+    return x, s
+
+
+# add the constraints for FDs over the tuple variables x
+# PAIRWISE: x[ii] + x[jj] <= 1 for every conflicting pair (ii, jj)
+# GROUP: one selector y per (LHS group, RHS value) with x[ii] <= y of its block,
+#        and at most one selector per LHS group (linear in the number of tuples)
+def add_fd_constraints(
+    model, x, t, delta, fd_encoding="PAIRWISE", integer=True, graph=None
+):
+    if fd_encoding == "PAIRWISE":
+        if graph is None:
+            graph = build_conflict_graph(t.df, delta)
+        u, v = graph.coo()
+        k = graph.nedges()
+        model.add_constrs(
+            k, np.r_[np.arange(k), np.arange(k)], np.r_[x[u], x[v]], 1.0, hi=1
+        )
+    elif fd_encoding == "GROUP":
+        rows, blocks, block_groups = build_fd_blocks(t.df, delta)
+        y = model.add_vars(block_groups.shape[0], integer=integer)
+        k = rows.shape[0]
+        model.add_constrs(
+            k,
+            np.r_[np.arange(k), np.arange(k)],
+            np.r_[x[rows], y[blocks]],
+            np.r_[np.ones(k), -np.ones(k)],
+            hi=0,
+        )
+        ngroups = int(block_groups.max()) + 1 if block_groups.shape[0] > 0 else 0
+        model.add_constrs(ngroups, block_groups, y, 1.0, hi=1)
+    else:
+        raise ValueError("Not Supported FD Encoding")
+
+
+# add the constraints for RC: for each color,
+#   #tuples of the color >= fraction of the color * #tuples
+# options: None, or a list of ColorDistributions of which exactly one is picked, and
+#          at most its count of each color added to the repair (the part of the
+#          repair that is solved outside of this model, any subset of which is
+#          conflict-free too)
+# output: the indices of the option variables, and those of the number of tuples of
+#         each color added from each option (one row per option, a column per color;
+#         they count in the objective)
+def add_rc_constraints(model, x, t, rc, options=None):
+    n_colors = t.color_distribution.c
+    colors = t.df[t.representative_column].to_numpy()
+    fractions = np.array([float(rc.constraint[t.labels[i]]) for i in range(n_colors)])
+    coef = (colors[None, :] == np.arange(n_colors)[:, None]) - fractions[:, None]
+    rows = np.repeat(np.arange(n_colors), x.shape[0])
+    cols = np.tile(x, n_colors)
+    vals = coef.ravel()
+    o = np.empty(0, dtype=np.int64)
+    y = np.empty((0, n_colors), dtype=np.int64)
+    if options is not None:
+        k = len(options)
+        o = model.add_vars(k, integer=True)
+        model.add_constrs(1, np.zeros(k), o, 1.0, lo=1, hi=1)
+        cnt = as_array(options, n_colors).ravel()
+        y = model.add_vars(k * n_colors, ub=cnt, integer=True)
+        # y[option, color] <= cnt[option, color] * o[option]
+        ids = np.arange(k * n_colors)
+        y_rows = np.r_[ids, ids]
+        y_cols = np.r_[y, np.repeat(o, n_colors)]
+        y_vals = np.r_[np.ones(k * n_colors), -cnt]
+        nonzero = y_vals != 0
+        model.add_constrs(
+            k * n_colors, y_rows[nonzero], y_cols[nonzero], y_vals[nonzero], hi=0
+        )
+        y_coef = np.eye(n_colors)[:, None, :] - fractions[:, None, None]
+        rows = np.r_[rows, np.repeat(np.arange(n_colors), k * n_colors)]
+        cols = np.r_[cols, np.tile(y, n_colors)]
+        vals = np.r_[vals, np.broadcast_to(y_coef, (n_colors, k, n_colors)).ravel()]
+        model.add_objective(y, 1.0)
+        y = y.reshape(k, n_colors)
+    nonzero = vals != 0
+    model.add_constrs(n_colors, rows[nonzero], cols[nonzero], vals[nonzero], lo=0)
+    return o, y
+
+
+# the model of globalilp (or of its LP relaxation) over the tuples (or classes,
+# weighted by counts) of t
+# output: (model, x, o, y), the indices of the tuple and option variables, and of the
+#         number of tuples of each color added from each option
+def rs_model(
+    t,
+    delta,
+    rc,
+    fd_encoding="PAIRWISE",
+    counts=None,
+    options=None,
+    integer=True,
+    graph=None,
+):
+    with tracing.span("build_model"):
+        model = LinearModel()
+        x, s = add_tuple_vars(model, t.df.shape[0], counts, integer)
+        model.add_objective(x, 1.0)
+        # add constraints for FDs
+        add_fd_constraints(model, s, t, delta, fd_encoding, integer, graph)
+        # add constraints for RC
+        o, y = add_rc_constraints(model, x, t, rc, options)
+        model.set_sense(maximize=True)
+    return model, x, o, y
+
+
 # globalilp
-# input: a Table t, a FDSet delta
+# input: a Table t, a FDSet delta, and optionally a list of repairs (sub-Tables of t,
+#        e.g., from the heuristics) given to the solver as MIP starts
 # output: a mapping ColorDistribution -> (Sub-)Table (without conflicts)
-def exact_by_grb_ilp(t, delta, rc, seed):
+def exact_by_grb_ilp(
+    t,
+    delta,
+    rc,
+    seed,
+    fd_encoding="PAIRWISE",
+    compress=False,
+    decompose=False,
+    max_component_size=20,
+    backend="GRB",
+    budget=None,
+    starts=None,
+):
     map = {t.get_empty_table().color_distribution: t.get_empty_table()}
+    # identical tuples (w.r.t. FDs and RC) share one integer variable
+    ct = CompressedTable(t, delta) if compress else None
+    _t = ct.table if compress else t
+    counts = ct.counts if compress else None
+    # the MIP starts as the number of kept tuples of each tuple (class) of _t
+    starts = [_kept_of_repair(t, ct, repair) for repair in (starts or [])]
 
-    m = gb.Model()
-    # multi-threading
-    m.setParam("Threads", 30)
-    # add seed
-    if seed is not None:
-        m.Params.Seed = seed
-    x = []
-
-    for i in range(t.df.shape[0]):
-        x.append(m.addVar(vtype=GRB.BINARY, name=f"r{i}"))
-
-    # add constraints for FDs
-    added = {}
-    for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            for i in range(len(all_idxs)):
-                for j in range(i + 1, len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        for jj in all_idxs[j]:
-                            if (ii, jj) not in added:
-                                m.addConstr(x[ii] + x[jj] <= 1)
-                                added[(ii, jj)] = 1
-
-    # add constraints for RC
-    for color in range(t.color_distribution.c):
-        expr = gb.LinExpr()
-        for idx, _ in t.df[t.df[t.representative_column] == color].iterrows():
-            expr += x[idx]
-        expr -= gb.quicksum(x) * rc.constraint[t.labels[color]]
-        m.addLConstr(expr, GRB.GREATER_EQUAL, 0)
-
-    m.setObjective(gb.quicksum(x), GRB.MAXIMIZE)
-    m.Params.LogToConsole = 0
-    m.optimize()
-
-    assert m.status == GRB.OPTIMAL
-
-    idxs = []
-    for v in m.getVars():
-        if v.VarName != "ans" and v.X != 0:
-            idxs.append(int(v.VarName[1:]))
-    t0 = Table(t.representative_column, t.df.iloc[idxs], t.labels)
+    if decompose:
+        return _exact_by_component_frontiers(
+            t,
+            ct,
+            _t,
+            counts,
+            delta,
+            rc,
+            seed,
+            fd_encoding,
+            max_component_size,
+            backend,
+            budget,
+            starts,
+        )
+
+    x, _ = _grb_rs_ilp(
+        _t,
+        delta,
+        rc,
+        seed,
+        fd_encoding,
+        counts,
+        backend=backend,
+        budget=budget,
+        starts=starts,
+    )
+    # without any solution within the time limit, only the empty repair is left
+    if x is None:
+        return map
+    t0 = _get_subtable_by_kept(t, ct, x)
     map[t0.color_distribution] = t0
     return map
 
 
+# the ILP of globalilp over the tuples (or classes, weighted by counts) of t
+# options: None, or a list of ColorDistributions of which exactly one is picked, and
+#          at most its count of each color added to the repair (the part of the
+#          repair that is solved outside of this ILP)
+# starts: MIP starts, each as the value of every tuple variable
+# graph: (Optional) the conflict graph of t
+# output: (the value of each tuple variable, the index of the chosen option and the
+#         number of tuples of each color added from it), or (None, None) if the time
+#         limit hit before any solution was found
+def _grb_rs_ilp(
+    t,
+    delta,
+    rc,
+    seed,
+    fd_encoding,
+    counts=None,
+    options=None,
+    backend="GRB",
+    budget=None,
+    starts=None,
+    graph=None,
+):
+    model, x, o, y = rs_model(t, delta, rc, fd_encoding, counts, options, graph=graph)
+    for kept in starts or []:
+        model.add_start(x, kept)
+    v = solve(model, backend, seed=seed, threads=30, budget=budget)
+    if v is None:
+        return None, None
+    chosen = None
+    if o.shape[0] > 0:
+        k = int(np.argmax(v[o]))
+        chosen = (k, np.rint(v[y[k]]).astype(np.int64))
+    return v[x], chosen
+
+
+# map a repair (a sub-Table of t, whose index may have been reset) to the number of
+# kept tuples of each tuple (class), matching the k-th copy of a row in the repair to
+# the k-th copy of it in t (copies of a row are interchangeable)
+def _kept_of_repair(t, ct, repair):
+    cols = list(t.df.columns)
+    left = t.df.assign(
+        __pos=np.arange(t.nrows()),
+        __k=t.df.groupby(cols, sort=False, dropna=False).cumcount(),
+    )
+    right = repair.df[cols].assign(
+        __k=repair.df.groupby(cols, sort=False, dropna=False).cumcount()
+    )
+    pos = left.merge(right, on=cols + ["__k"], how="inner")["__pos"].to_numpy()
+    kept = np.zeros(t.nrows())
+    kept[pos] = 1
+    if ct is None:
+        return kept
+    return np.bincount(ct.classes, weights=kept, minlength=ct.nclasses())
+
+
+# map the value of each tuple (class) variable back to a sub-table of t
+def _get_subtable_by_kept(t, ct, kept):
+    if ct is not None:
+        return ct.get_subtable_by_kept(np.rint(kept).astype(np.int64))
+    idxs = np.flatnonzero(np.rint(kept) != 0)
+    return t.get_subtable_by_positions(idxs)
+
+
+# the color counts of the (weighted) nodes idxs
+def _color_counts(idxs, colors, w, n_colors):
+    cnt = np.bincount(colors[idxs], weights=w[idxs], minlength=n_colors)
+    return cnt.astype(np.int64)
+
+
+# the frontier of a connected component, from its maximal independent sets (every
+# subset of an independent set is independent, so these dominate all the others)
+# output: a ParetoFrontier of the nodes, or None if there are too many sets
+def _component_frontier(nodes, adj, colors, w, n_colors, max_sets=1024):
+    complement = nx.complement(nx.from_scipy_sparse_array(adj[nodes][:, nodes]))
+    counts, sets = [], []
+    for k, clique in enumerate(nx.find_cliques(complement)):
+        if k >= max_sets:
+            return None
+        idxs = nodes[np.sort(clique)]
+        counts.append(_color_counts(idxs, colors, w, n_colors))
+        sets.append(idxs)
+    return ParetoFrontier.from_candidates(n_colors, counts, sets)
+
+
+# the number of kept tuples of each of the (weighted) nodes, keeping the first
+# taken[c] tuples of each color c
+def _take_colors(nodes, colors, w, taken):
+    kept = np.zeros(nodes.shape[0], dtype=np.int64)
+    for c, k in enumerate(taken.tolist()):
+        idxs = np.flatnonzero(colors[nodes] == c)
+        before = np.cumsum(w[nodes[idxs]]) - w[nodes[idxs]]
+        kept[idxs] = np.clip(k - before, 0, w[nodes[idxs]])
+    return kept
+
+
+# follow the back-pointers of a merged frontier entry
+def _nodes_of(ref):
+    nodes = []
+    while ref is not None:
+        ref, idxs = ref
+        nodes.append(idxs)
+    return np.concatenate(nodes)
+
+
+# globalilp by decomposition: the RC couples the connected components of the
+# conflict graph only through the total color counts, so each small component is
+# solved into its frontier of non-dominated ColorDistributions, the frontiers are
+# merged as in the common-LHS case of s_repair, and a single ILP is solved only for
+# the components that are too large to enumerate (choosing one merged frontier entry)
+def _exact_by_component_frontiers(
+    t,
+    ct,
+    _t,
+    counts,
+    delta,
+    rc,
+    seed,
+    fd_encoding,
+    max_component_size,
+    backend="GRB",
+    budget=None,
+    starts=None,
+):
+    map = {t.get_empty_table().color_distribution: t.get_empty_table()}
+    n_colors = _t.color_distribution.c
+    w = counts if counts is not None else np.ones(_t.nrows(), dtype=np.int64)
+    colors = _t.df[_t.representative_column].to_numpy()
+
+    graph = build_conflict_graph(_t.df, delta)
+    adj = graph.csr()
+    _, component = connected_components(adj, directed=False)
+    order = np.argsort(component, kind="stable")
+    members = np.split(order, np.cumsum(np.bincount(component))[:-1])
+    tracing.count("components", len(members))
+
+    # tuples without conflicts are always kept
+    free = np.flatnonzero(graph.degrees() == 0)
+    frontier = ParetoFrontier.from_candidates(
+        n_colors, _color_counts(free, colors, w, n_colors), [(None, free)]
+    )
+    large = []
+    for nodes in members:
+        if nodes.shape[0] < 2:
+            continue
+        component_frontier = None
+        if nodes.shape[0] <= max_component_size:
+            component_frontier = _component_frontier(nodes, adj, colors, w, n_colors)
+        if component_frontier is None:
+            large.append(nodes)
+            continue
+        # each value keeps a back-pointer to its parts
+        frontier = frontier.merge(component_frontier)
+        tracing.observe("component_frontier_size", len(frontier))
+    frontier = frontier.to_dict()
+
+    if len(large) > 0:
+        t0 = _solve_large_components(
+            t,
+            ct,
+            _t,
+            counts,
+            w,
+            graph,
+            large,
+            frontier,
+            delta,
+            rc,
+            seed,
+            fd_encoding,
+            backend,
+            budget,
+            starts,
+        )
+        if t0 is not None:
+            map[t0.color_distribution] = t0
+            return map
+        # without any solution within the time limit, drop the large components
+
+    for ref in frontier.values():
+        kept = np.zeros(w.shape[0], dtype=np.int64)
+        nodes = _nodes_of(ref)
+        kept[nodes] = w[nodes]
+        t0 = _get_subtable_by_kept(t, ct, kept)
+        map[t0.color_distribution] = t0
+    return map
+
+
+# the single ILP over the large components, with one binary choice among the
+# entries of the merged frontier of the small ones, of which it keeps as many tuples
+# of each color as the RC allows (the MIP starts only fix the tuples of the large
+# components); the conflict graph of the large components is cut out of graph
+# output: the repair, or None if the time limit hit before any solution was found
+def _solve_large_components(
+    t,
+    ct,
+    _t,
+    counts,
+    w,
+    graph,
+    large,
+    frontier,
+    delta,
+    rc,
+    seed,
+    fd_encoding,
+    backend,
+    budget,
+    starts=None,
+):
+    large = np.sort(np.concatenate(large))
+    options = list(frontier.keys())
+    x, chosen = _grb_rs_ilp(
+        _t.get_subtable_by_positions(large),
+        delta,
+        rc,
+        seed,
+        fd_encoding,
+        counts[large] if counts is not None else None,
+        options,
+        backend,
+        budget,
+        [kept[large] for kept in starts or []],
+        graph.subgraph(large),
+    )
+    if x is None:
+        return None
+    kept = np.zeros(w.shape[0], dtype=np.int64)
+    kept[large] = np.rint(x).astype(np.int64)
+    k, taken = chosen
+    nodes = _nodes_of(frontier[options[k]])
+    colors = _t.df[_t.representative_column].to_numpy()
+    kept[nodes] = _take_colors(nodes, colors, w, taken)
+    return _get_subtable_by_kept(t, ct, kept)
+
+
 # ilp-baseline
 # input: a Table t, a FDSet delta
 # output: (Sub-)Table (without conflicts)
-def exact_by_grb_ilp_wo_rc(t, delta, seed):
-    m = gb.Model()
-    m.setParam("Threads", 30)
-
-    x = []
-    if seed is not None:
-        m.Params.Seed = seed
-
-    for i in range(t.df.shape[0]):
-        x.append(m.addVar(vtype=GRB.BINARY, name=f"r{i}"))
-
-    added = {}
-    for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            for i in range(len(all_idxs)):
-                for j in range(i + 1, len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        for jj in all_idxs[j]:
-                            if (ii, jj) not in added:
-                                m.addConstr(x[ii] + x[jj] >= 1)
-                                added[(ii, jj)] = 1
-
-    m.setObjective(gb.quicksum(x[i] for i in range(len(x))), GRB.MINIMIZE)
+def exact_by_grb_ilp_wo_rc(t, delta, seed, compress=False, backend="GRB", budget=None):
+    # identical tuples (w.r.t. FDs) are removed or kept together, weighted by count
+    ct = CompressedTable(t, delta) if compress else None
+    _t = ct.table if compress else t
+    w = ct.counts if compress else np.ones(t.df.shape[0])
+
+    # x[i] = 1 iff the tuple (class) i is removed
+    model = LinearModel()
+    x = model.add_vars(_t.df.shape[0], integer=True)
+    u, v = build_conflict_graph(_t.df, delta).coo()
+    k = u.shape[0]
+    model.add_constrs(
+        k, np.r_[np.arange(k), np.arange(k)], np.r_[x[u], x[v]], 1.0, lo=1
+    )
+    model.add_objective(x, w)
+    model.set_sense(maximize=False)
 
     print("Start Optimization")
-    m.Params.LogToConsole = 0
-    m.optimize()
+    v = solve(model, backend, seed=seed, threads=30, budget=budget)
+    # without any solution within the time limit, fall back to the empty repair
+    if v is None:
+        return t.get_empty_table()
+    # an incumbent (under a time limit) is integral only up to the tolerance
+    removed = np.rint(v[x])
 
-    assert m.status == GRB.OPTIMAL
+    if compress:
+        return ct.get_subtable_by_kept(np.where(removed == 0, w, 0))
 
-    idxs = [i for i, v in enumerate(m.getVars()) if v.X == 0]
+    idxs = np.flatnonzero(removed == 0)
 
-    t0 = Table(t.representative_column, t.df.iloc[idxs], t.labels)
+    t0 = t.get_subtable_by_positions(idxs)
 
     return t0
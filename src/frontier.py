@@ -0,0 +1,119 @@
+import numpy as np
+from color_distribution import as_array, from_array
+
+# the number of candidate entries compared at once
+_BLOCK = 1 << 20
+
+
+# A frontier of non-dominated ColorDistributions, each with a value (a repair or a
+# back-pointer), kept as a matrix of color counts (one row per entry) and a list of
+# values. It has the semantics of inserting the candidates one by one into a dict
+# (skipping a candidate equal to or dominated by an entry, and deleting the entries
+# it dominates): the entries are the maximal candidates, each with the value of its
+# first occurrence, in the order of their first occurrence.
+class ParetoFrontier:
+    def __init__(self, n_colors, counts=None, values=None):
+        self.c = n_colors
+        self.counts = (
+            counts if counts is not None else np.empty((0, n_colors), dtype=np.int64)
+        )
+        self.values = values if values is not None else []
+
+    # the frontier of candidates (a matrix of counts and their values), in order
+    @staticmethod
+    def from_candidates(n_colors, counts, values):
+        counts = np.asarray(counts, dtype=np.int64).reshape(-1, n_colors)
+        keep = _skyline(counts)
+        return ParetoFrontier(n_colors, counts[keep], [values[i] for i in keep])
+
+    # the frontier of a mapping ColorDistribution -> value
+    @staticmethod
+    def from_dict(m, n_colors):
+        return ParetoFrontier.from_candidates(
+            n_colors, as_array(m.keys(), n_colors), list(m.values())
+        )
+
+    def to_dict(self):
+        return dict(zip(from_array(self.counts), self.values))
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    # the entries at the given positions, in order
+    def select(self, idxs):
+        return ParetoFrontier(
+            self.c, self.counts[idxs], [self.values[i] for i in idxs.tolist()]
+        )
+
+    # the frontier of the entries of self followed by those of other
+    def union(self, other):
+        return ParetoFrontier.from_candidates(
+            self.c,
+            np.concatenate([self.counts, other.counts]),
+            self.values + other.values,
+        )
+
+    # the frontier of all the sums s + s0 (s of self, s0 of other, s-major), each
+    # value a back-pointer (value of s, value of s0); the sums are generated for a
+    # chunk of entries of self at a time and pruned together with the entries kept so
+    # far, so that only O(|chunk| x |other|) dominated sums exist at once
+    def merge(self, other):
+        n0 = len(other)
+        counts = np.empty((0, self.c), dtype=np.int64)
+        pairs = np.empty((0, 2), dtype=np.int64)
+        step = max(1, _BLOCK // max(1, n0 * self.c * 16))
+        for start in range(0, len(self), step):
+            idxs = np.arange(start, min(start + step, len(self)))
+            sums = (self.counts[idxs, None, :] + other.counts[None, :, :]).reshape(
+                -1, self.c
+            )
+            chunk_pairs = np.stack(
+                [np.repeat(idxs, n0), np.tile(np.arange(n0), idxs.shape[0])], axis=1
+            )
+            counts = np.concatenate([counts, sums])
+            pairs = np.concatenate([pairs, chunk_pairs])
+            keep = _skyline(counts)
+            counts, pairs = counts[keep], pairs[keep]
+        return ParetoFrontier(
+            self.c,
+            counts,
+            [(self.values[i], other.values[j]) for i, j in pairs.tolist()],
+        )
+
+
+# the positions (sorted) of the maximal rows of counts, keeping the first of equal ones
+def _skyline(counts):
+    n, c = counts.shape
+    if n <= 1:
+        return np.arange(n)
+    pos = np.arange(n)
+    if c == 1:
+        return pos[counts[:, 0] == counts[:, 0].max()][:1]
+    if c == 2:
+        # sweep by decreasing first count: a row is kept iff its second count beats
+        # those of all the rows before it (ties on both are kept in order, the first
+        # of them only)
+        order = np.lexsort((pos, -counts[:, 1], -counts[:, 0]))
+        y = counts[order, 1]
+        best = np.maximum.accumulate(y)
+        keep = order[y > np.r_[-1, best[:-1]]]
+        return np.sort(keep)
+    # dominance index: by decreasing sum (a dominating row has a larger sum, an equal
+    # row a smaller position), a row is kept iff no kept row before it covers it
+    order = np.lexsort((pos, -counts.sum(axis=1)))
+    x = counts[order]
+    kept = np.zeros(n, dtype=bool)
+    step = max(1, int(np.sqrt(_BLOCK // c)))
+    for start in range(0, n, step):
+        end = min(start + step, n)
+        blk = x[start:end]
+        prev = x[:start][kept[:start]]
+        covered = (prev[None, :, :] >= blk[:, None, :]).all(axis=2).any(axis=1)
+        # within the block, in order
+        inner = (blk[None, :, :] >= blk[:, None, :]).all(axis=2)
+        inner &= np.tri(end - start, k=-1, dtype=bool)
+        for i in range(end - start):
+            if not covered[i]:
+                kept[start + i] = True
+                covered |= inner[:, i]
+    return np.sort(order[kept])
@@ -235,7 +235,9 @@ def parse(fd_in_str, table):
     fds = []
     for i in range(len(l_rhs)):
         rhs = l_rhs[i]
-        fds.append(FD(LHS(lhs_in_str.split(",")), RHS(rhs)))
+        # an empty LHS ("-> A") is a consensus FD
+        lhs = [col for col in lhs_in_str.split(",") if col != ""]
+        fds.append(FD(LHS(lhs), RHS(rhs)))
         assert fds[-1].check_names(table)
     return fds
 
@@ -0,0 +1,216 @@
+from driver import load_data, solve
+import argparse
+import glob
+import json
+import os
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+
+
+# the experiment grid under data_dir: data_dir/input_data_{dataset}/{fd_type}/ holds
+# the relations {size}_{noise}_dirty.csv, one FD set *fdset.txt and the RCs *_rc.txt
+# output: a list of inputs (dicts), one per (relation, RC)
+def discover_inputs(data_dir):
+    inputs = []
+    for input_dir in sorted(glob.glob(os.path.join(data_dir, "input_data_*", "*", ""))):
+        fdsets = sorted(glob.glob(os.path.join(input_dir, "*fdset.txt")))
+        rcs = sorted(glob.glob(os.path.join(input_dir, "*_rc.txt")))
+        if len(fdsets) != 1 or len(rcs) == 0:
+            continue
+        dataset = os.path.basename(os.path.dirname(os.path.dirname(input_dir)))[
+            len("input_data_") :
+        ]
+        fd_type = os.path.basename(os.path.dirname(input_dir))
+        for relation in glob.glob(os.path.join(input_dir, "*_dirty.csv")):
+            size, noise, _ = os.path.basename(relation).split("_")
+            for rc in rcs:
+                inputs.append(
+                    {
+                        "dataset": dataset,
+                        "fd_type": fd_type,
+                        "input_size": int(size),
+                        "noise": float(noise),
+                        "relation": relation,
+                        "fdset": fdsets[0],
+                        "rc": rc,
+                    }
+                )
+    inputs.sort(
+        key=lambda x: (x["dataset"], x["fd_type"], x["input_size"], x["noise"], x["rc"])
+    )
+    return inputs
+
+
+# the directory of the results of an input under a seed
+def job_dir(result_dir, input, seed):
+    return os.path.join(
+        result_dir,
+        input["dataset"],
+        input["fd_type"],
+        os.path.splitext(os.path.basename(input["relation"]))[0],
+        os.path.splitext(os.path.basename(input["rc"]))[0],
+        f"seed_{seed}",
+        "",
+    )
+
+
+# a (solver, seed) of an input is finished iff its record has been written
+def record_filename(result_dir, input, solver, seed):
+    return job_dir(result_dir, input, seed) + solver + ".json"
+
+
+# run the pending (solver, seed) jobs of an input, parsing the input only once
+# output: the records of the finished jobs
+def run_input(input, jobs, result_dir, options):
+    t, delta, rc = load_data(input["relation"], input["fdset"], input["rc"])
+    records = []
+    for solver, seed in jobs:
+        res_dir = job_dir(result_dir, input, seed)
+        os.makedirs(res_dir, exist_ok=True)
+        try:
+            summary = solve(
+                t, delta, rc, res_dir, solver=[solver], seed=seed, **options
+            )[0]
+        except Exception as e:
+            # leave the job unfinished, it is retried by the next run
+            print(f"Failed: {input['relation']} {input['rc']} {solver} {seed}: {e!r}")
+            continue
+        record = dict(input, seed=seed, **summary)
+        with open(record_filename(result_dir, input, solver, seed), "w") as fout:
+            json.dump(record, fout)
+        records.append(record)
+    return records
+
+
+# consolidate all the records under result_dir into grid.json and grid.csv
+def consolidate(result_dir):
+    records = []
+    for filename in sorted(
+        glob.glob(os.path.join(result_dir, "**", "*.json"), recursive=True)
+    ):
+        # skip the consolidated file and the traces of the solvers
+        if os.path.basename(filename) == "grid.json" or filename.endswith(
+            "_trace.json"
+        ):
+            continue
+        with open(filename, "r") as fin:
+            records.append(json.load(fin))
+    os.makedirs(result_dir, exist_ok=True)
+    with open(os.path.join(result_dir, "grid.json"), "w") as fout:
+        json.dump(records, fout, indent=1)
+    df = pd.DataFrame(records)
+    if "distribution" in df.columns:
+        df["distribution"] = df["distribution"].map(json.dumps)
+    df.to_csv(os.path.join(result_dir, "grid.csv"), index=False)
+    return records
+
+
+# run every (input, solver, seed) of the grid that has not finished yet, in a pool
+# of n_jobs processes (one task per input), then consolidate the results
+def run_grid(
+    data_dir,
+    result_dir,
+    solvers,
+    seeds,
+    n_jobs=1,
+    pattern=None,
+    threads=None,
+    **options,
+):
+    tasks = []
+    for input in discover_inputs(data_dir):
+        if (
+            pattern is not None
+            and re.search(pattern, input["relation"] + " " + input["rc"]) is None
+        ):
+            continue
+        jobs = [
+            (solver, seed)
+            for seed in seeds
+            for solver in solvers
+            if not os.path.exists(record_filename(result_dir, input, solver, seed))
+        ]
+        if len(jobs) > 0:
+            tasks.append((input, jobs))
+    print(f"{sum(len(jobs) for _, jobs in tasks)} jobs to run over {len(tasks)} inputs")
+
+    # each concurrent job gets an equal share of the cores, unless threads is given
+    if threads is None and n_jobs > 1:
+        threads = max(1, (os.cpu_count() or 1) // n_jobs)
+    options = dict(options, threads=threads)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [
+                pool.submit(run_input, input, jobs, result_dir, options)
+                for input, jobs in tasks
+            ]
+            for future in as_completed(futures):
+                future.result()
+    else:
+        for input, jobs in tasks:
+            run_input(input, jobs, result_dir, options)
+    return consolidate(result_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default="../data/",
+        help="the (related) directory of the input_data_* directories",
+    )
+    parser.add_argument(
+        "--result_dir",
+        type=str,
+        default="../result/grid/",
+        help="the (related) output directory, also used to skip the finished jobs",
+    )
+    parser.add_argument(
+        "--solvers",
+        type=str,
+        default="lhschain_dp,globalilp,lp_greedyrounding,lp_reprrounding,fdcleanser,vc_approx_baseline",
+        help="comma-separated list of solvers",
+    )
+    parser.add_argument(
+        "--seeds", type=str, default="42", help="comma-separated list of random seeds"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="(Optional) the number of worker processes"
+    )
+    parser.add_argument(
+        "--filter",
+        type=str,
+        default=None,
+        help="(Optional) only run the inputs whose relation or RC path matches this regex",
+    )
+    parser.add_argument(
+        "--fd_encoding", type=str, default="pairwise", choices=["pairwise", "group"]
+    )
+    parser.add_argument("--compress", action="store_true", default=False)
+    parser.add_argument("--decompose", action="store_true", default=False)
+    parser.add_argument("--backend", type=str, default="grb", choices=["grb", "highs"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--time_limit", type=float, default=None)
+    parser.add_argument("--mip_gap", type=float, default=None)
+    args = parser.parse_args()
+
+    run_grid(
+        args.data_dir,
+        args.result_dir,
+        args.solvers.split(","),
+        [int(seed) for seed in args.seeds.split(",")],
+        n_jobs=args.jobs,
+        pattern=args.filter,
+        threads=args.threads,
+        fd_encoding=args.fd_encoding.upper(),
+        compress=args.compress,
+        decompose=args.decompose,
+        backend=args.backend.upper(),
+        time_limit=args.time_limit,
+        mip_gap=args.mip_gap,
+    )
@@ -0,0 +1,299 @@
+from time import time
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import csr_matrix
+import tracing
+
+# Gurobi is optional: without it (or without a license) use the HiGHS backend
+try:
+    import gurobipy as gb
+    from gurobipy import GRB
+except ImportError:
+    gb = None
+
+
+# A (mixed integer) linear program in matrix form:
+#   maximize/minimize c^T v  s.t.  lo <= A v <= hi,  lb <= v <= ub
+# Variables are added in blocks (add_vars returns their indices) and constraints are
+# added as blocks of sparse triplets, so that a model is built with a few NumPy
+# operations and handed to the solver in one go.
+class LinearModel:
+    def __init__(self):
+        self.n = 0
+        self.m = 0
+        self._lb, self._ub, self._integrality = [], [], []
+        self._rows, self._cols, self._vals = [], [], []
+        self._lo, self._hi = [], []
+        self._obj_cols, self._obj_vals = [], []
+        self.maximize = True
+        self.starts = []
+
+    # add k variables, return their indices
+    def add_vars(self, k, lb=0.0, ub=1.0, integer=False):
+        idx = np.arange(self.n, self.n + k, dtype=np.int64)
+        self._lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (k,)))
+        self._ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (k,)))
+        self._integrality.append(np.full(k, 1 if integer else 0, dtype=np.int8))
+        self.n += k
+        return idx
+
+    # add k constraints lo <= A v <= hi, A given by triplets (rows in [0, k))
+    def add_constrs(self, k, rows, cols, vals, lo=-np.inf, hi=np.inf):
+        rows = np.asarray(rows, dtype=np.int64)
+        self._rows.append(rows + self.m)
+        self._cols.append(np.asarray(cols, dtype=np.int64))
+        self._vals.append(np.broadcast_to(np.asarray(vals, dtype=float), rows.shape))
+        self._lo.append(np.broadcast_to(np.asarray(lo, dtype=float), (k,)))
+        self._hi.append(np.broadcast_to(np.asarray(hi, dtype=float), (k,)))
+        self.m += k
+
+    # add a linear term sum(vals * v[cols]) to the objective
+    def add_objective(self, cols, vals):
+        cols = np.asarray(cols, dtype=np.int64)
+        self._obj_cols.append(cols)
+        self._obj_vals.append(
+            np.broadcast_to(np.asarray(vals, dtype=float), cols.shape)
+        )
+
+    # add a (partial) starting solution: the values of the variables cols, the
+    # other variables are left to the solver
+    def add_start(self, cols, vals):
+        self.starts.append(
+            (np.asarray(cols, dtype=np.int64), np.asarray(vals, dtype=float))
+        )
+
+    def set_sense(self, maximize=True):
+        self.maximize = maximize
+
+    def bounds(self):
+        return _concat(self._lb, float), _concat(self._ub, float)
+
+    def integrality(self):
+        return _concat(self._integrality, np.int8)
+
+    def objective(self):
+        c = np.zeros(self.n)
+        np.add.at(c, _concat(self._obj_cols, np.int64), _concat(self._obj_vals, float))
+        return c
+
+    def constraints(self):
+        A = csr_matrix(
+            (
+                _concat(self._vals, float),
+                (_concat(self._rows, np.int64), _concat(self._cols, np.int64)),
+            ),
+            shape=(self.m, self.n),
+        )
+        return A, _concat(self._lo, float), _concat(self._hi, float)
+
+
+def _concat(arrays, dtype):
+    if len(arrays) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
+
+
+# the solvers a LinearModel can be handed to
+BACKENDS = ["GRB", "HIGHS"]
+# the relative gap at which both solvers call a MIP optimal by default
+DEFAULT_MIP_GAP = 1e-4
+
+
+# The resources given to the solves of one run: the number of threads, a wall-clock
+# limit (in secs.) shared by all the solves from the creation of the budget, and a
+# relative MIP gap at which to stop. When a limit hits, the best incumbent is used;
+# each solve appends a report (status, incumbent objective, bound, gap) to reports.
+class SolverBudget:
+    def __init__(self, threads=None, time_limit=None, mip_gap=None):
+        self.threads = threads
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
+        self.deadline = time() + time_limit if time_limit is not None else None
+        self.reports = []
+        # the time (in secs.) of the work reused from an earlier solver (e.g., a
+        # cached LP relaxation), which counts in the time of this one
+        self.reused_time = 0.0
+
+    # the time left (in secs.), or None if there is no time limit
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time(), 0.0)
+
+    # the reports of the solves that stopped before proving optimality
+    def non_optimal_reports(self):
+        return [
+            report
+            for report in self.reports
+            if report["status"] != "OPTIMAL" or report["gap"] > DEFAULT_MIP_GAP
+        ]
+
+
+def _report(backend, status, objective, bound):
+    if objective is None or bound is None:
+        gap = np.inf
+    else:
+        gap = abs(bound - objective) / max(abs(objective), 1e-10)
+    return {
+        "backend": backend,
+        "status": status,
+        "objective": objective,
+        "bound": bound,
+        "gap": gap,
+    }
+
+
+# solve a LinearModel with the given backend ("GRB" or "HIGHS"); the threads,
+# time limit and MIP gap of the budget (if any) override the defaults
+# output: the values of all the variables (one NumPy array), or None if the time
+# limit hit before any feasible solution was found
+def solve(model, backend="GRB", seed=None, threads=None, budget=None):
+    time_limit, mip_gap = None, None
+    if budget is not None:
+        if budget.threads is not None:
+            threads = budget.threads
+        time_limit = budget.remaining()
+        mip_gap = budget.mip_gap
+
+    # the size of the (I)LPs, as "ilp_rows"/"ilp_cols" or "lp_rows"/"lp_cols"
+    kind = "ilp" if model.integrality().any() else "lp"
+    tracing.count(kind + "_solves")
+    tracing.count(kind + "_rows", model.m)
+    tracing.count(kind + "_cols", model.n)
+    with tracing.span("solve_" + kind):
+        if backend == "GRB":
+            values, report = solve_by_grb(model, seed, threads, time_limit, mip_gap)
+        elif backend == "HIGHS":
+            values, report = solve_by_highs(model, seed, threads, time_limit, mip_gap)
+        else:
+            raise ValueError("Not Supported Backend")
+
+    if budget is not None:
+        budget.reports.append(report)
+    if values is None:
+        return None
+    # the integer variables are integral only up to the solver's feasibility
+    # tolerance (e.g., 0.9999999), so round them
+    return np.where(model.integrality() == 1, np.rint(values), values)
+
+
+# build the LinearModel with the matrix API of Gurobi and solve it
+# output: (the values of the variables, the report of the solve)
+def solve_by_grb(model, seed=None, threads=None, time_limit=None, mip_gap=None):
+    if model.n == 0:
+        return np.empty(0), _report("GRB", "OPTIMAL", 0.0, 0.0)
+    if gb is None:
+        raise ImportError("gurobipy is not installed, use the HIGHS backend")
+
+    m = gb.Model()
+    # multi-threading
+    if threads is not None:
+        m.setParam("Threads", threads)
+    # add seed
+    if seed is not None:
+        m.Params.Seed = seed
+    if time_limit is not None:
+        m.Params.TimeLimit = time_limit
+    if mip_gap is not None:
+        m.Params.MIPGap = mip_gap
+
+    lb, ub = model.bounds()
+    vtype = np.where(
+        model.integrality() == 1,
+        np.where((lb >= 0) & (ub <= 1), GRB.BINARY, GRB.INTEGER),
+        GRB.CONTINUOUS,
+    )
+    v = m.addMVar(model.n, lb=lb, ub=ub, vtype=vtype)
+
+    A, lo, hi = model.constraints()
+    eq = lo == hi
+    ge = ~eq & np.isfinite(lo)
+    le = ~eq & np.isfinite(hi)
+    # keep the constraints in their order; a ranged row becomes a >= and a <= row
+    sel = np.concatenate([np.flatnonzero(eq | ge), np.flatnonzero(le)])
+    sense = np.concatenate(
+        [
+            np.where(eq[eq | ge], GRB.EQUAL, GRB.GREATER_EQUAL),
+            np.full(int(le.sum()), GRB.LESS_EQUAL),
+        ]
+    )
+    rhs = np.concatenate([lo[eq | ge], hi[le]])
+    order = np.argsort(sel, kind="stable")
+    if sel.shape[0] > 0:
+        m.addMConstr(A[sel[order]], v, sense[order], rhs[order])
+
+    m.setObjective(
+        model.objective() @ v, GRB.MAXIMIZE if model.maximize else GRB.MINIMIZE
+    )
+    # MIP starts (Gurobi completes the partial ones)
+    if len(model.starts) > 0:
+        m.NumStart = len(model.starts)
+        m.update()
+        for k, (cols, vals) in enumerate(model.starts):
+            m.Params.StartNumber = k
+            start = np.full(model.n, GRB.UNDEFINED)
+            start[cols] = vals
+            v.Start = start
+    m.Params.LogToConsole = 0
+    m.optimize()
+
+    if m.status == GRB.OPTIMAL:
+        status = "OPTIMAL"
+    elif m.status == GRB.TIME_LIMIT:
+        status = "TIME_LIMIT"
+    else:
+        raise ValueError(f"Gurobi stopped with status {m.status}")
+
+    # the dual bound of a MIP (an optimal LP is its own bound)
+    bound = m.ObjBound if m.IsMIP else None
+    if m.SolCount == 0:
+        return None, _report("GRB", status, None, bound)
+    if not m.IsMIP and status == "OPTIMAL":
+        bound = m.ObjVal
+    return v.X, _report("GRB", status, m.ObjVal, bound)
+
+
+# solve the LinearModel with HiGHS (scipy.optimize.milp), which takes the sparse
+# constraint matrix as is; scipy does not expose the seed, the number of threads
+# and the MIP starts of HiGHS, so they are ignored
+# output: (the values of the variables, the report of the solve)
+def solve_by_highs(model, seed=None, threads=None, time_limit=None, mip_gap=None):
+    if model.n == 0:
+        return np.empty(0), _report("HIGHS", "OPTIMAL", 0.0, 0.0)
+
+    options = {}
+    if time_limit is not None:
+        options["time_limit"] = time_limit
+        # HiGHS does not check the clock during presolve, which alone can take far
+        # longer than the limit on the large pairwise models
+        options["presolve"] = False
+    if mip_gap is not None:
+        options["mip_rel_gap"] = mip_gap
+
+    lb, ub = model.bounds()
+    c = model.objective()
+    A, lo, hi = model.constraints()
+    res = milp(
+        -c if model.maximize else c,
+        integrality=model.integrality(),
+        bounds=Bounds(lb, ub),
+        constraints=[LinearConstraint(A, lo, hi)] if model.m > 0 else None,
+        options=options,
+    )
+
+    if res.status == 0:
+        status = "OPTIMAL"
+    elif res.status == 1:
+        status = "TIME_LIMIT"
+    else:
+        raise ValueError(f"HiGHS stopped with status {res.status}: {res.message}")
+
+    # milp minimizes, so flip the signs back for a maximization
+    sign = -1.0 if model.maximize else 1.0
+    bound = getattr(res, "mip_dual_bound", None)
+    if bound is None and status == "OPTIMAL":
+        bound = res.fun
+    bound = sign * bound if bound is not None else None
+    if res.x is None:
+        return None, _report("HIGHS", status, None, bound)
+    return res.x, _report("HIGHS", status, sign * res.fun, bound)
@@ -1,93 +1,96 @@
-import gurobipy as gb
-from gurobipy import gurobipy
-from gurobipy import GRB
 import numpy as np
+from linear_model import LinearModel, solve
 from utility import global_random_seed, eps
 import copy
-from color_distribution import ColorDistribution
+from color_distribution import as_array, better_than
 
 
 # le -> ri -> list of ColorDistribution
 # ri -> le -> list of ColorDistribution
-def matching(l_edges, r_edges, n_colors, rc, labels, method):
+def matching(
+    l_edges, r_edges, n_colors, rc, labels, method, backend="GRB", budget=None
+):
     if method in ["GRB_ILP", "GRB_LP_ROUNDING", "GRB_LP_FRACTIONAL_LOOP_ELIMINATION"]:
-        return grb_matching(l_edges, r_edges, n_colors, rc, labels, method=method[4:])
+        return grb_matching(
+            l_edges,
+            r_edges,
+            n_colors,
+            rc,
+            labels,
+            method=method[4:],
+            backend=backend,
+            budget=budget,
+        )
     else:
         raise ValueError("Not Supported Optimizer")
 
 
-def grb_matching(l_edges, r_edges, n_colors, rc, labels, method):
-    m = gb.Model()
-    s = m.addVar(vtype=GRB.CONTINUOUS, name="ans")
-    x = {}
-
-    for le in l_edges.keys():
-        for ri in l_edges[le].keys():
-            for which in range(len(l_edges[le][ri])):
-                if method == "ILP":
-                    x[le, ri, which] = m.addVar(
-                        vtype=GRB.BINARY, name=f"x({le}|{ri}|{which})"
-                    )
-                elif method in ["LP_ROUNDING", "LP_FRACTIONAL_LOOP_ELIMINATION"]:
-                    x[le, ri, which] = m.addVar(
-                        lb=0.0,
-                        ub=1.0,
-                        vtype=GRB.CONTINUOUS,
-                        name=f"x({le}|{ri}|{which})",
-                    )
-
-    for le in l_edges.keys():
-        expr = gb.LinExpr()
-        for ri in l_edges[le].keys():
-            for which in range(len(l_edges[le][ri])):
-                expr += x[le, ri, which]
-        m.addLConstr(expr, GRB.LESS_EQUAL, 1)
-
-    for ri in r_edges.keys():
-        expr = gb.LinExpr()
+def grb_matching(
+    l_edges, r_edges, n_colors, rc, labels, method, backend="GRB", budget=None
+):
+    # one variable per (le, ri, which) edge, in the order of l_edges
+    keys = [
+        (le, ri, which)
+        for le in l_edges.keys()
+        for ri in l_edges[le].keys()
+        for which in range(len(l_edges[le][ri]))
+    ]
+    key_to_id = {key: id for id, key in enumerate(keys)}
+
+    model = LinearModel()
+    s = model.add_vars(1, lb=0.0, ub=np.inf)
+    x = model.add_vars(len(keys), integer=method == "ILP")
+
+    # each left node and each right node is matched at most once
+    l_ids = {le: i for i, le in enumerate(l_edges.keys())}
+    rows = np.array([l_ids[le] for le, _, _ in keys], dtype=np.int64)
+    model.add_constrs(len(l_ids), rows, x, 1.0, hi=1.0)
+    rows, cols = [], []
+    for i, ri in enumerate(r_edges.keys()):
         for le in r_edges[ri].keys():
             for which in range(len(r_edges[ri][le])):
-                expr += x[le, ri, which]
-        m.addLConstr(expr, GRB.LESS_EQUAL, 1)
-
-    for color in range(n_colors):
-        expr = gb.LinExpr()
-        expr += s * rc.constraint[labels[color]]
-        for le in l_edges.keys():
-            for ri in l_edges[le].keys():
-                for which in range(len(l_edges[le][ri])):
-                    count = l_edges[le][ri][which].get_c(color)
-                    expr -= x[le, ri, which] * count
-        m.addLConstr(expr, GRB.LESS_EQUAL, 0)
-
-    m.setObjective(s, GRB.MAXIMIZE)
-    m.Params.LogToConsole = 0
-    m.optimize()
-
-    assert m.status == GRB.OPTIMAL
+                rows.append(i)
+                cols.append(x[key_to_id[le, ri, which]])
+    model.add_constrs(len(r_edges), rows, cols, 1.0, hi=1.0)
+
+    # s * frac(color) <= number of tuples of each color
+    counts = as_array(
+        [l_edges[le][ri][which] for le, ri, which in keys], n_colors
+    ).astype(float)
+    frac = np.array([rc.constraint[labels[color]] for color in range(n_colors)])
+    rows = np.concatenate(
+        [np.arange(n_colors), np.repeat(np.arange(n_colors), len(keys))]
+    )
+    cols = np.concatenate([np.repeat(s, n_colors), np.tile(x, n_colors)])
+    vals = np.concatenate([frac, -counts.T.ravel()])
+    # zero counts are left out of the matrix rather than kept as zero coefficients
+    nonzero = vals != 0
+    model.add_constrs(n_colors, rows[nonzero], cols[nonzero], vals[nonzero], hi=0.0)
+
+    model.add_objective(s, 1.0)
+    model.set_sense(maximize=True)
+    v = solve(model, backend, budget=budget)
+    # without any solution within the time limit, match nothing
+    if v is None:
+        return []
+    values = v[x]
 
     y = []
     if method in ["ILP", "LP_ROUNDING"]:
         r = np.random.RandomState(seed=global_random_seed)
-        for v in m.getVars():
-            if v.VarName != "ans":
-                if (method == "ILP" and v.X == 1) or (
-                    method == "LP_ROUNDING" and r.rand() <= v.X
-                ):
-                    _v = v.VarName[2:-1].split("|")
-                    le, ri, which = _v[0], _v[1], int(_v[2])
-                    y.append((le, ri, which))
+        for key, value in zip(keys, values):
+            if (method == "ILP" and value > 0.5) or (
+                method == "LP_ROUNDING" and r.rand() <= value
+            ):
+                y.append(key)
         return y
     elif method == "LP_FRACTIONAL_LOOP_ELIMINATION":
         edges = [[], []]
-        for v in m.getVars():
-            if v.VarName != "ans":
-                _v = v.VarName[2:-1].split("|")
-                le, ri, which = _v[0], _v[1], int(_v[2])
-                if v.X == 1.0:
-                    y.append((le, ri, which))
-                elif v.X > 0.0 and v.X < 1.0:
-                    edges[0].append([le, ri, which, v.X])
+        for (le, ri, which), value in zip(keys, values):
+            if value > 1 - eps:
+                y.append((le, ri, which))
+            elif value >= eps:
+                edges[0].append([le, ri, which, value])
 
         # eliminate loops
         ii = 0
@@ -99,13 +102,17 @@ def grb_matching(l_edges, r_edges, n_colors, rc, labels, method):
             for id in loop:
                 epsilon = min(epsilon, min(edges[ii][id][3], 1 - edges[ii][id][3]))
 
-            _d = [ColorDistribution(n_colors), ColorDistribution(n_colors)]
-            for i in range(len(loop)):
-                id = loop[i]
-                le, ri, which = edges[ii][id][0], edges[ii][id][1], edges[ii][id][2]
-                _d[i % 2] += l_edges[le][ri][which]
-
-            if not _d[0].better_than(_d[1], rc, labels):
+            # the color counts of the even and of the odd edges of the loop
+            cnt = as_array(
+                [
+                    l_edges[edges[ii][id][0]][edges[ii][id][1]][edges[ii][id][2]]
+                    for id in loop
+                ],
+                n_colors,
+            )
+            _d = [cnt[0::2].sum(axis=0), cnt[1::2].sum(axis=0)]
+
+            if not better_than(_d[0], _d[1], rc, labels):
                 epsilon *= -1
 
             for id in loop:
@@ -113,15 +120,10 @@ def grb_matching(l_edges, r_edges, n_colors, rc, labels, method):
                 epsilon *= -1.0
             edges[1 - ii].clear()
             for i in range(len(edges[ii])):
-                if edges[ii][i][3] < eps:
-                    edges[ii][i][3] = 0.0
                 if edges[ii][i][3] > 1 - eps:
-                    edges[ii][i][3] = 1.0
-
-                if edges[ii][i][3] < 1.0 and edges[ii][i][3] > 0.0:
-                    edges[1 - ii].append(copy.deepcopy(edges[ii][i]))
-                elif edges[ii][i][3] == 1.0:
                     y.append((edges[ii][i][0], edges[ii][i][1], edges[ii][i][2]))
+                elif edges[ii][i][3] >= eps:
+                    edges[1 - ii].append(copy.deepcopy(edges[ii][i]))
             ii = 1 - ii
 
         # eliminate trees
@@ -131,12 +133,7 @@ def grb_matching(l_edges, r_edges, n_colors, rc, labels, method):
             cds.append(l_edges[le][ri][which])
         _post_optimize(edges[ii], n_colors, cds, rc, labels)
         for i in range(len(edges[ii])):
-            if edges[ii][i][3] < eps:
-                edges[ii][i][3] = 0.0
             if edges[ii][i][3] > 1 - eps:
-                edges[ii][i][3] = 1.0
-
-            if edges[ii][i][3] == 1.0:
                 y.append((edges[ii][i][0], edges[ii][i][1], edges[ii][i][2]))
         return y
 
@@ -178,12 +175,12 @@ def _post_optimize(edges, n_colors, cds, rc, labels):
             vis[id] = True
             _visit_tree(edges=edges, paths=paths, adj=[ltr, rtl], vis=vis)
 
-            _d = [ColorDistribution(n_colors), ColorDistribution(n_colors)]
-            for path_i in range(2):
-                for id in paths[path_i]:
-                    _d[path_i] += cds[id]
+            _d = [
+                as_array([cds[id] for id in paths[path_i]], n_colors).sum(axis=0)
+                for path_i in range(2)
+            ]
 
-            path_i = 0 if _d[0].better_than(_d[1], rc, labels) else 1
+            path_i = 0 if better_than(_d[0], _d[1], rc, labels) else 1
             for id in paths[path_i]:
                 edges[id][3] = 1.0
             for id in paths[1 - path_i]:
@@ -1,23 +1,33 @@
-from table import Table
+from table import Table, materialize
 from representative_constraint import RepresentativeConstraint
 import math
 import random
+import numpy as np
+import tracing
 from utility import global_random_seed
+from color_distribution import ColorDistribution, as_array
+from frontier import ParetoFrontier
 
 
 # PostClean
 def postclean(r, rc):
     assert isinstance(r, Table)
     assert isinstance(rc, RepresentativeConstraint)
+    return r.get_subtable_by_nums(_demand(r.color_distribution, rc))
 
+
+# the number of tuples of each color kept by PostClean from a repair of ColorDistribution cd
+def _demand(cd, rc):
     random.seed(global_random_seed)
-    for t in range(r.nrows(), -1, -1):
+    # no size above the bound can meet the RC
+    counts = as_array([cd], cd.c)
+    for t in range(int(_upper(counts, rc)[0]), -1, -1):
         b = True
         min_demand = {}
         for i in range(rc.c):
             fraction = rc.constraint[rc.labels[i]]
             min_demand[i] = math.ceil(t * fraction.numerator / fraction.denominator)
-            if min_demand[i] > r.color_distribution.get_c(i):
+            if min_demand[i] > cd.get_c(i):
                 b = False
                 break
         t0 = 0
@@ -26,18 +36,78 @@ def postclean(r, rc):
         if b and t0 <= t:
             while t0 < t:
                 i = random.randint(0, rc.c - 1)
-                while min_demand[i] >= r.color_distribution.get_c(i):
+                while min_demand[i] >= cd.get_c(i):
                     i = random.randint(0, rc.c - 1)
                 min_demand[i] += 1
                 t0 += 1
-            return r.get_subtable_by_nums(min_demand)
-    return r.get_empty_table()
+            return min_demand
+    return {}
+
+
+# an upper bound on the size of PostClean of each row of a matrix of color counts:
+# a size t needs t * fraction <= count for each color (and t <= the sum of counts)
+def _upper(counts, rc):
+    res = counts.sum(axis=1)
+    for i in range(rc.c):
+        fraction = rc.constraint[rc.labels[i]]
+        if fraction.numerator > 0:
+            res = np.minimum(
+                res, counts[:, i] * fraction.denominator // fraction.numerator
+            )
+    return res
+
+
+# Bounds of the RS-repair along a DP over the partitions of a table (s_repair): any
+# sub-repair in a frontier is a repair of the table by itself, so the largest size
+# of PostClean of one seen so far (the incumbent) is a lower bound of the optimum;
+# and a repair extending a sub-repair of color counts d, where the rest of the table
+# has at most outer tuples of each color, gets no more than _upper(d + outer)
+class RCBound:
+    def __init__(self, rc):
+        self.rc = rc
+        self.incumbent = 0
+
+    # raise the incumbent with the most promising repair of a ParetoFrontier
+    def update(self, frontier):
+        if len(frontier) == 0:
+            return
+        upper = _upper(frontier.counts, self.rc)
+        best = int(np.argmax(upper))
+        if upper[best] > self.incumbent:
+            cd = ColorDistribution.from_counts(frontier.counts[best].tolist())
+            demand = _demand(cd, self.rc)
+            self.incumbent = max(self.incumbent, int(sum(demand.values())))
+
+    # raise the incumbent with a repair of one sub-repair of each ParetoFrontier (of
+    # disjoint parts of a table), picked in order to keep the bound the highest, where
+    # the parts after each one have at most rest tuples of each color
+    def update_by_greedy(self, frontiers, rest):
+        total = np.zeros(rest.shape[1], dtype=np.int64)
+        for frontier, r in zip(frontiers, rest):
+            upper = _upper(total + frontier.counts + r, self.rc)
+            total = total + frontier.counts[int(np.argmax(upper))]
+        self.update(ParetoFrontier(rest.shape[1], total.reshape(1, -1), [None]))
+
+    # the sub-repairs of a ParetoFrontier that may still extend to a repair at
+    # least as good as the incumbent (ties are kept, so the repair picked by
+    # postclean_for_set is unchanged)
+    def prune(self, frontier, outer):
+        if len(frontier) == 0:
+            return frontier
+        keep = np.flatnonzero(
+            _upper(frontier.counts + outer, self.rc) >= self.incumbent
+        )
+        tracing.count("rc_pruned", len(frontier) - keep.shape[0])
+        return frontier.select(keep)
 
 
+# PostClean every repair of a mapping ColorDistribution -> repair (a Table or a
+# back-pointer, see materialize) and keep the largest; the sizes only depend on the
+# distributions, so only the repair picked is rebuilt
 def postclean_for_set(repairs, rc):
-    optimal = None
-    for _, r in repairs.items():
-        rprime = postclean(r, rc)
-        if optimal is None or rprime.nrows() > optimal.nrows():
-            optimal = rprime
-    return optimal
+    optimal, optimal_demand = None, None
+    for cd, r in repairs.items():
+        demand = _demand(cd, rc)
+        if optimal is None or sum(demand.values()) > sum(optimal_demand.values()):
+            optimal, optimal_demand = r, demand
+    return materialize(optimal).get_subtable_by_nums(optimal_demand)
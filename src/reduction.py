@@ -1,14 +1,20 @@
-import copy
 from enum import Enum
 from matching import matching
 from exact import exact, exact_by_grb_ilp_wo_rc
 from approx import approx
-from table import Table
+from table import Table, materialize
+import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from scipy.optimize import linear_sum_assignment
 from tqdm import tqdm
 from vertex_cover_approx import vertex_cover_approximation
-from postclean import postclean_for_set
+from postclean import postclean_for_set, RCBound
+from linear_model import SolverBudget
+from frontier import ParetoFrontier
+from reduction_plan import ReductionStep, plan_reduction
+from color_distribution import as_array
+import tracing
 
 
 class AfterReduction(Enum):
@@ -23,7 +29,15 @@ class AfterReduction(Enum):
 
 # lhschain
 # input: a Table t, a FDSet delta
-# output: a mapping ColorDistribution -> (Sub-)Table (without conflicts)
+# output: a mapping ColorDistribution -> (Sub-)Table (without conflicts), where a
+#         (Sub-)Table may be a back-pointer to the two repairs it is the union of
+#         (see materialize), so that only the repair finally picked is rebuilt
+# bound: (Optional) a RCBound shared by the whole recursion, to drop the repairs that
+#        cannot extend to an optimal RS-repair after PostClean (the output then only
+#        keeps the ones postclean_for_set may pick); outer: the most tuples of each
+#        color the rest of the table (outside t) can add to a repair of t
+# jobs: (Optional) the number of processes that repair the partitions of the first
+#       common-LHS or consensus reduction with more than one partition
 def s_repair(
     t,
     delta,
@@ -31,74 +45,209 @@ def s_repair(
     after_reduction=AfterReduction.ERROR,
     matching_method="GRB_ILP",
     seed=None,
+    backend="GRB",
+    budget=None,
+    bound=None,
+    outer=None,
+    jobs=None,
 ):
-    # trivial
-    delta.eliminate_trivial_fds()
-    if delta.n == 0:
+    # one span per depth of the recursion, and the size of the frontier it returns
+    with tracing.span("s_repair"):
+        tracing.count("recursion_nodes")
+        if bound is not None and outer is None:
+            outer = np.zeros(t.color_distribution.c, dtype=np.int64)
+        m = _s_repair(
+            t,
+            delta,
+            rc,
+            after_reduction,
+            matching_method,
+            seed,
+            backend,
+            budget,
+            bound,
+            outer,
+            jobs,
+        )
+        tracing.observe("frontier_size", len(m), key=tracing.depth("s_repair"))
+    return m
+
+
+def _s_repair(
+    t,
+    delta,
+    rc=None,
+    after_reduction=AfterReduction.ERROR,
+    matching_method="GRB_ILP",
+    seed=None,
+    backend="GRB",
+    budget=None,
+    bound=None,
+    outer=None,
+    jobs=None,
+):
+    # the reduction of delta (the same for all the sub-tables of a FDSet)
+    plan = plan_reduction(delta)
+    delta = plan.delta
+    if plan.step == ReductionStep.NO_FD:
         # no FD
         _t = t.copy()
         return {_t.color_distribution: _t}
     # common lhs
-    col = delta.find_common_lhs()
-    if col is not None:
+    if plan.step == ReductionStep.COMMON_LHS:
+        col = plan.col
         # initialization
-        m = [{t.get_empty_table().color_distribution: t.get_empty_table()}, {}]
-        ii = 0
-        for val in t.get_distinct_vals_of(col):
-            m0 = s_repair(
-                t.get_subtable_by_filter(col, val),
-                delta.remove_cols([col]),
-                rc,
-                after_reduction,
-            )
-            for s in m[ii]:
-                for s0 in m0:
-                    s_plus_s0 = s + s0
-                    if s_plus_s0 not in m[1 - ii]:
-                        all_s = list(m[1 - ii].keys())
-                        flag = True
-                        for ss in all_s:
-                            if ss < s_plus_s0:
-                                del m[1 - ii][ss]
-                            if s_plus_s0 < ss:
-                                flag = False
-                                break
-                        if flag:
-                            m[1 - ii][s_plus_s0] = m[ii][s] + m0[s0]
-            m[ii].clear()
-            ii = 1 - ii
-        return m[ii]
+        n_colors = t.color_distribution.c
+        m = ParetoFrontier.from_dict(
+            {t.get_empty_table().color_distribution: t.get_empty_table()}, n_colors
+        )
+        subs = t.partition(col)
+        if jobs is not None and jobs > 1 and len(subs) > 1:
+            # each batch of partitions is repaired (by this reduction) into the
+            # frontier of its partitions, and the frontiers are merged in order
+            batches = _batches(subs, jobs)
+            outers = [None] * len(batches)
+            if bound is not None:
+                counts = np.array(
+                    [
+                        as_array(
+                            [sub.color_distribution for sub in batch], n_colors
+                        ).sum(axis=0)
+                        for batch in batches
+                    ]
+                )
+                outers = list(outer + counts.sum(axis=0) - counts)
+            frontiers = [
+                ParetoFrontier(n_colors, counts, [t._view(rows) for rows in repairs])
+                for counts, repairs in _in_parallel(
+                    t,
+                    delta,
+                    batches,
+                    _repair_batch,
+                    outers,
+                    jobs,
+                    dict(
+                        rc=rc,
+                        after_reduction=after_reduction,
+                        backend=backend,
+                        budget=budget,
+                        bound=bound,
+                    ),
+                )
+            ]
+            if bound is None:
+                for f in frontiers:
+                    m = m.merge(f)
+                return m.to_dict()
+            if any(len(f) == 0 for f in frontiers):
+                return {}
+        elif bound is None:
+            for sub in subs:
+                m0 = s_repair(
+                    sub,
+                    plan.child.delta,
+                    rc,
+                    after_reduction,
+                    backend=backend,
+                    budget=budget,
+                    jobs=jobs if len(subs) == 1 else None,
+                )
+                # the non-dominated sums s + s0, with back-pointers to their parts
+                m = m.merge(ParetoFrontier.from_dict(m0, n_colors))
+            return m.to_dict()
+        else:
+            # with a bound, repair all the partitions first: then the most tuples of
+            # each color the partitions after each one can add bound the merge, and a
+            # greedy pick of one sub-repair per partition raises the incumbent
+            counts = as_array([sub.color_distribution for sub in subs], n_colors)
+            frontiers = []
+            for sub, cnt in zip(subs, counts):
+                m0 = s_repair(
+                    sub,
+                    plan.child.delta,
+                    rc,
+                    after_reduction,
+                    backend=backend,
+                    budget=budget,
+                    bound=bound,
+                    outer=outer + counts.sum(axis=0) - cnt,
+                    jobs=jobs if len(subs) == 1 else None,
+                )
+                if len(m0) == 0:
+                    # no repair of t extends to one as good as the incumbent
+                    return {}
+                frontiers.append(ParetoFrontier.from_dict(m0, n_colors))
+        tops = np.array([f.counts.max(axis=0) for f in frontiers]).reshape(-1, n_colors)
+        rest = np.cumsum(tops[::-1], axis=0)[::-1] - tops
+        bound.update_by_greedy(frontiers, rest)
+        for f, r in zip(frontiers, rest):
+            m = m.merge(f)
+            bound.update(m)
+            m = bound.prune(m, outer + r)
+            if len(m) == 0:
+                break
+        return m.to_dict()
     # consensus
-    fd_id = delta.find_consensus_fd_id()
-    if fd_id is not None:
+    if plan.step == ReductionStep.CONSENSUS:
         # initialization
-        m = {}
-        col = delta.fds[fd_id].rhs.col
-        for val in t.get_distinct_vals_of(col):
-            m0 = s_repair(
-                t.get_subtable_by_filter(col, val),
-                delta.remove_cols([col]),
-                rc,
-                after_reduction,
+        n_colors = t.color_distribution.c
+        m = ParetoFrontier(n_colors)
+        col = plan.col
+        subs = t.partition(col)
+        if jobs is not None and jobs > 1 and len(subs) > 1:
+            # each batch of partitions is repaired (by this reduction) into the union
+            # of the frontiers of its partitions
+            batches = _batches(subs, jobs)
+            frontiers = [
+                ParetoFrontier(n_colors, counts, [t._view(rows) for rows in repairs])
+                for counts, repairs in _in_parallel(
+                    t,
+                    delta,
+                    batches,
+                    _repair_batch,
+                    [outer] * len(batches),
+                    jobs,
+                    dict(
+                        rc=rc,
+                        after_reduction=after_reduction,
+                        backend=backend,
+                        budget=budget,
+                        bound=bound,
+                    ),
+                )
+            ]
+        else:
+            frontiers = (
+                ParetoFrontier.from_dict(
+                    # a repair keeps one partition only, so the rest of the table is
+                    # outer
+                    s_repair(
+                        sub,
+                        plan.child.delta,
+                        rc,
+                        after_reduction,
+                        backend=backend,
+                        budget=budget,
+                        bound=bound,
+                        outer=outer,
+                        jobs=jobs if len(subs) == 1 else None,
+                    ),
+                    n_colors,
+                )
+                for sub in subs
             )
-            for s0 in m0:
-                if s0 not in m:
-                    all_s = list(m.keys())
-                    flag = True
-                    for s in all_s:
-                        if s < s0:
-                            del m[s]
-                        if s0 < s:
-                            flag = False
-                            break
-                    if flag:
-                        m[s0] = m0[s0].copy()
+        for f in frontiers:
+            m = m.union(f)
+            if bound is not None:
+                bound.update(m)
+                m = bound.prune(m, outer)
+        m = m.to_dict()
         if len(m) == 0:
             m = {t.get_empty_table().color_distribution: t.get_empty_table()}
         return m
-    # lhs marriage (deprecated as future work)
-    lhs_marriage_or_none = delta.find_lhs_marriage()
-    if lhs_marriage_or_none is not None:
+    # lhs marriage (deprecated as future work); the matching does not maximize the
+    # size after PostClean, so the sub-repairs are not pruned by the bound
+    if plan.step == ReductionStep.LHS_MARRIAGE:
         # initialization
         m = {}
 
@@ -108,20 +257,17 @@ def s_repair(
 
         repairs = {}
 
-        lhs1, lhs2 = lhs_marriage_or_none
-        combos = t.group_by_two_lhs(lhs1, lhs2)
-        for _, row in combos.iterrows():
-            predicates = []
-            for col in combos.columns:
-                predicates.append(f"({col} == '{row[col]}')")
+        lhs1, lhs2 = plan.lhs1, plan.lhs2
+        les, ris, subs = t.group_by_two_lhs(lhs1, lhs2)
+        for le, ri, sub in zip(les.tolist(), ris.tolist(), subs):
             m0 = s_repair(
-                t.get_subtable_by_query(" & ".join(predicates)),
-                delta.remove_cols(copy.deepcopy(lhs1.cols) + copy.deepcopy(lhs2.cols)),
+                sub,
+                plan.child.delta,
                 rc,
                 after_reduction,
+                backend=backend,
+                budget=budget,
             )
-            le = ",".join([row[col] for col in lhs1.cols])
-            ri = ",".join([row[col] for col in lhs2.cols])
             if le not in l_edges:
                 l_edges[le] = {}
             if ri not in l_edges[le]:
@@ -139,10 +285,20 @@ def s_repair(
                 r_edges[ri][le].append(k)
                 repairs[le][ri].append(v)
 
-        res = matching(l_edges, r_edges, n_colors, rc, t.labels, matching_method)
+        with tracing.span("matching"):
+            res = matching(
+                l_edges,
+                r_edges,
+                n_colors,
+                rc,
+                t.labels,
+                matching_method,
+                backend=backend,
+                budget=budget,
+            )
         t0 = t.get_empty_table()
         for le, ri, which in res:
-            t0 = t0 + repairs[le][ri][which]
+            t0 = t0 + materialize(repairs[le][ri][which])
         m[t0.color_distribution] = t0
         return m
     #    print('After reduction:', after_reduction)
@@ -150,16 +306,42 @@ def s_repair(
         raise ValueError("Reach a failure after reduction")
     elif after_reduction == AfterReduction.ILP:
         assert rc is not None
-        return exact(t, delta, rc, method="GRB_ILP", seed=seed)
+        return exact(
+            t, delta, rc, method="GRB_ILP", seed=seed, backend=backend, budget=budget
+        )
     elif after_reduction == AfterReduction.LP_ROUNDING:
         assert rc is not None
-        return approx(t, delta, rc, method="GRB_LP_ROUNDING", seed=seed)
+        return approx(
+            t,
+            delta,
+            rc,
+            method="GRB_LP_ROUNDING",
+            seed=seed,
+            backend=backend,
+            budget=budget,
+        )
     elif after_reduction == AfterReduction.LP_GREEDY_ROUNDING:
         assert rc is not None
-        return approx(t, delta, rc, method="GRB_LP_GREEDY_ROUNDING", seed=seed)
+        return approx(
+            t,
+            delta,
+            rc,
+            method="GRB_LP_GREEDY_ROUNDING",
+            seed=seed,
+            backend=backend,
+            budget=budget,
+        )
     elif after_reduction == AfterReduction.LP_NEW_GREEDY_ROUNDING:
         assert rc is not None
-        return approx(t, delta, rc, method="GRB_LP_NEW_GREEDY_ROUNDING", seed=seed)
+        return approx(
+            t,
+            delta,
+            rc,
+            method="GRB_LP_NEW_GREEDY_ROUNDING",
+            seed=seed,
+            backend=backend,
+            budget=budget,
+        )
     elif after_reduction == AfterReduction.MOST_FREQUENT_COL:
         assert not delta.empty()
         t0 = t.copy()
@@ -173,6 +355,10 @@ def s_repair(
                 after_reduction=AfterReduction.ERROR,
                 matching_method="GRB_ILP",
                 seed=seed,
+                backend=backend,
+                budget=budget,
+                bound=RCBound(rc),
+                jobs=jobs,
             )
             t0 = postclean_for_set(m, rc)
             delta0 = delta0.get_subfdset_by_ids(
@@ -195,71 +381,141 @@ class AfterReduction_wo_rc(Enum):
 
 
 def s_repair_wo_rc(
-    t, delta, after_reduction=AfterReduction_wo_rc.APPROX, seed=None
+    t,
+    delta,
+    after_reduction=AfterReduction_wo_rc.APPROX,
+    seed=None,
+    compress=False,
+    backend="GRB",
+    budget=None,
+    jobs=None,
+):
+    with tracing.span("s_repair_wo_rc"):
+        tracing.count("recursion_nodes")
+        return _s_repair_wo_rc(
+            t, delta, after_reduction, seed, compress, backend, budget, jobs
+        )
+
+
+def _s_repair_wo_rc(
+    t,
+    delta,
+    after_reduction=AfterReduction_wo_rc.APPROX,
+    seed=None,
+    compress=False,
+    backend="GRB",
+    budget=None,
+    jobs=None,
 ):  # do approximation if no reduction
-    # trivial
-    delta.eliminate_trivial_fds()
-    if delta.n == 0:
+    # the reduction of delta (the same for all the sub-tables of a FDSet)
+    plan = plan_reduction(delta)
+    delta = plan.delta
+    if plan.step == ReductionStep.NO_FD:
         # no FD
         return t
     # common lhs
-    col = delta.find_common_lhs()
-    if col is not None:
+    if plan.step == ReductionStep.COMMON_LHS:
+        col = plan.col
         # initialization
         res = t.get_empty_table()
-        for val in t.get_distinct_vals_of(col):
+        subs = t.partition(col)
+        if jobs is not None and jobs > 1 and len(subs) > 1:
+            # each batch of partitions is repaired (by this reduction) into the union
+            # of the repairs of its partitions, concatenated in order
+            for rows in _in_parallel(
+                t,
+                delta,
+                _batches(subs, jobs),
+                _repair_batch_wo_rc,
+                None,
+                jobs,
+                dict(
+                    after_reduction=after_reduction,
+                    seed=seed,
+                    compress=compress,
+                    backend=backend,
+                    budget=budget,
+                ),
+            ):
+                res += t._view(rows)
+            return res
+        for sub in subs:
             t0 = s_repair_wo_rc(
-                t.get_subtable_by_filter(col, val),
-                delta.remove_cols([col]),
+                sub,
+                plan.child.delta,
+                after_reduction,
+                seed,
+                compress=compress,
+                backend=backend,
+                budget=budget,
+                jobs=jobs if len(subs) == 1 else None,
             )
             res += t0
         return res
     # consensus
-    fd_id = delta.find_consensus_fd_id()
-    if fd_id is not None:
+    if plan.step == ReductionStep.CONSENSUS:
         # initialization
-        col = delta.fds[fd_id].rhs.col
+        col = plan.col
         res = t.get_empty_table()
-        for val in t.get_distinct_vals_of(col):
+        subs = t.partition(col)
+        if jobs is not None and jobs > 1 and len(subs) > 1:
+            # each batch of partitions is repaired (by this reduction) into the
+            # largest repair of its partitions
+            for rows in _in_parallel(
+                t,
+                delta,
+                _batches(subs, jobs),
+                _repair_batch_wo_rc,
+                None,
+                jobs,
+                dict(
+                    after_reduction=after_reduction,
+                    seed=seed,
+                    compress=compress,
+                    backend=backend,
+                    budget=budget,
+                ),
+            ):
+                if rows.shape[0] > res.nrows():
+                    res = t._view(rows)
+            return res
+        for sub in subs:
             t0 = s_repair_wo_rc(
-                t.get_subtable_by_filter(col, val), delta.remove_cols([col])
+                sub,
+                plan.child.delta,
+                after_reduction,
+                seed,
+                compress=compress,
+                backend=backend,
+                budget=budget,
+                jobs=jobs if len(subs) == 1 else None,
             )
             if t0.nrows() > res.nrows():
                 res = t0
         return res
     # lhs marriage
-    lhs_marriage_or_none = delta.find_lhs_marriage()
-    if lhs_marriage_or_none is not None:
+    if plan.step == ReductionStep.LHS_MARRIAGE:
         # initialization
-        edges = []
-        lhs1, lhs2 = lhs_marriage_or_none
-        combos = t.group_by_two_lhs(lhs1, lhs2)
-        le_to_idx = {}
-        le_cnt = 0
-        ri_to_idx = {}
-        ri_cnt = 0
+        lhs1, lhs2 = plan.lhs1, plan.lhs2
+        les, ris, subs = t.group_by_two_lhs(lhs1, lhs2)
         sub_repairs = {}
-        for _, row in combos.iterrows():
-            predicates = []
-            for col in combos.columns:
-                predicates.append(f"({col} == '{row[col]}')")
+        c = np.full(
+            shape=(les.max(initial=-1) + 1, ris.max(initial=-1) + 1),
+            fill_value=(1 << 31) - 1,
+            dtype=int,
+        )
+        for le, ri, sub in zip(les.tolist(), ris.tolist(), subs):
             t0 = s_repair_wo_rc(
-                t.get_subtable_by_query(" & ".join(predicates)),
-                delta.remove_cols(copy.deepcopy(lhs1.cols) + copy.deepcopy(lhs2.cols)),
+                sub,
+                plan.child.delta,
+                after_reduction,
+                seed,
+                compress=compress,
+                backend=backend,
+                budget=budget,
             )
-            le = ",".join([row[col] for col in lhs1.cols])
-            ri = ",".join([row[col] for col in lhs2.cols])
-            edges.append((le, ri, t0.nrows()))
-            if le not in le_to_idx:
-                le_to_idx[le] = le_cnt
-                le_cnt += 1
-            if ri not in ri_to_idx:
-                ri_to_idx[ri] = ri_cnt
-                ri_cnt += 1
-            sub_repairs[(le_to_idx[le], ri_to_idx[ri])] = t0
-        c = np.full(shape=(le_cnt, ri_cnt), fill_value=(1 << 31) - 1, dtype=int)
-        for edge in edges:
-            c[le_to_idx[edge[0]], ri_to_idx[edge[1]]] = -edge[2]
+            c[le, ri] = -t0.nrows()
+            sub_repairs[(le, ri)] = t0
         le_idx, ri_idx = linear_sum_assignment(c)
         res = t.get_empty_table()
         for i in range(len(le_idx)):
@@ -270,15 +526,131 @@ def s_repair_wo_rc(
     if after_reduction == AfterReduction_wo_rc.ERROR:
         raise ValueError("Reach a failure after reduction")
     elif after_reduction == AfterReduction_wo_rc.APPROX:
-        res = vertex_cover_approximation(t, delta, seed=seed)
+        with tracing.span("vertex_cover"):
+            res = vertex_cover_approximation(t, delta, seed=seed, compress=compress)
         return res
     elif after_reduction == AfterReduction_wo_rc.ILP:
-        res = exact_by_grb_ilp_wo_rc(t, delta, seed=seed)
+        res = exact_by_grb_ilp_wo_rc(
+            t, delta, seed=seed, compress=compress, backend=backend, budget=budget
+        )
         return res
     else:
         raise NotImplementedError
 
 
+# Partitions in parallel: the partitions of a reduction are split into batches of
+# consecutive partitions, and each batch, as the view of the tuples of its
+# partitions, is repaired by the same reduction in a worker process. The batches
+# keep the order of the partitions, and their results (the positions of the tuples
+# of the repairs) are merged in the order of the batches, so the repair is the same
+# as the serial one. A randomized repair (the vertex cover of s_repair_wo_rc) is
+# only the same with a seed: each worker has its own copy of the random state.
+
+
+# the partitions in at most 4 * jobs batches of consecutive partitions of about as
+# many tuples each
+def _batches(subs, jobs):
+    sizes = np.array([sub.nrows() for sub in subs], dtype=np.int64)
+    n_batches = min(len(subs), 4 * jobs)
+    ids = ((np.cumsum(sizes) - sizes) * n_batches // max(1, sizes.sum())).tolist()
+    batches = []
+    for sub, i, prev in zip(subs, ids, [None] + ids[:-1]):
+        if i != prev:
+            batches.append([])
+        batches[-1].append(sub)
+    return batches
+
+
+# the table, FD set and options (keyword arguments of the recursion) of a worker
+_partition_instance = None
+
+
+# stack: the open spans of the caller, under which the tracer of the worker records
+def _init_partition_worker(t, delta, options, stack):
+    global _partition_instance
+    _partition_instance = (t, delta, options)
+    if stack is not None:
+        tracing.start(stack)
+
+
+# the trace of a task (since the previous one), and the reports of its solves
+def _worker_logs(reports, n_reports):
+    tracer = tracing.stop()
+    trace = tracer.to_dict() if tracer is not None else None
+    if tracer is not None:
+        tracing.start(tracer.stack)
+    return trace, reports[n_reports:]
+
+
+# the batch is repaired by _s_repair (the reduction of the caller, not a node of the
+# recursion of its own), so its children are traced at the depths they would have
+# output: (the counts and the positions of the tuples of the repairs of the frontier
+#         of a batch, the trace and the reports of its solves)
+def _repair_batch(rows, outer):
+    t, delta, options = _partition_instance
+    reports = options["budget"].reports
+    n_reports = len(reports)
+    m = _s_repair(t._view(rows), delta, outer=outer, **options)
+    res = (
+        as_array(m.keys(), t.color_distribution.c),
+        [materialize(r).rows for r in m.values()],
+    )
+    return res, *_worker_logs(reports, n_reports)
+
+
+# output: (the positions of the tuples of the repair of a batch, the trace and the
+#         reports of its solves)
+def _repair_batch_wo_rc(rows, outer):
+    t, delta, options = _partition_instance
+    reports = options["budget"].reports
+    n_reports = len(reports)
+    res = _s_repair_wo_rc(t._view(rows), delta, **options)
+    return res.rows, *_worker_logs(reports, n_reports)
+
+
+# run task on each batch (with its outer, if any) in a pool of jobs processes; as in
+# solve_in_parallel, each worker gets an equal share of the threads of the solver
+# (all the cores by default), and the traces and the reports of the workers are
+# added to those of the caller (so the span of a batch counts the time of its worker)
+# output: the results of the batches, in order
+def _in_parallel(t, delta, batches, task, outers, jobs, options):
+    if outers is None:
+        outers = [None] * len(batches)
+    workers = min(jobs, len(batches))
+    budget = options["budget"]
+    if budget is not None and budget.threads is not None:
+        threads = budget.threads
+    else:
+        threads = os.cpu_count() or 1
+    worker_budget = SolverBudget(
+        max(1, threads // workers),
+        budget.remaining() if budget is not None else None,
+        budget.mip_gap if budget is not None else None,
+    )
+    with tracing.span("parallel_partitions"):
+        tracing.count("parallel_batches", len(batches))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_partition_worker,
+            initargs=(t, delta, dict(options, budget=worker_budget), tracing.stack()),
+        ) as pool:
+            results = list(
+                pool.map(
+                    task,
+                    [np.concatenate([sub.rows for sub in batch]) for batch in batches],
+                    outers,
+                )
+            )
+        res = []
+        for r, trace, reports in results:
+            if trace is not None:
+                tracing.merge(trace)
+            if budget is not None:
+                budget.reports.extend(reports)
+            res.append(r)
+    return res
+
+
 class ReductionState(Enum):
     SUCCESS = 0
     FAILURE = 1
@@ -286,32 +658,4 @@ class ReductionState(Enum):
 
 
 def validate_reduction(_delta):
-    delta = _delta.copy()
-    flag = True
-    while delta.n > 0 and flag:
-        flag = False
-        _n = delta.n
-        delta.eliminate_trivial_fds()
-        if delta.n < _n:
-            flag = True
-            continue
-        col = delta.find_common_lhs()
-        if col is not None:
-            delta = delta.remove_cols([col])
-            flag = True
-            continue
-        fd_id = delta.find_consensus_fd_id()
-        if fd_id is not None:
-            col = delta.fds[fd_id].rhs.col
-            delta = delta.remove_cols([col])
-            flag = True
-            continue
-        lhs_marriage_or_none = delta.find_lhs_marriage()
-        if lhs_marriage_or_none is not None:
-            lhs1, lhs2 = lhs_marriage_or_none
-            delta = delta.remove_cols(
-                copy.deepcopy(lhs1.cols) + copy.deepcopy(lhs2.cols)
-            )
-            flag = True
-            continue
-    return delta.n == 0
+    return plan_reduction(_delta).succeeds()
@@ -0,0 +1,77 @@
+import copy
+from enum import Enum
+import tracing
+
+
+class ReductionStep(Enum):
+    NO_FD = 0
+    COMMON_LHS = 1
+    CONSENSUS = 2
+    LHS_MARRIAGE = 3
+    IRREDUCIBLE = 4
+
+
+# A ReductionPlan is the reduction s_repair applies to a FDSet, which only depends
+# on the FDSet and not on the data: its step, the FDSet delta it applies to (without
+# trivial FDs), the column it partitions by (the common LHS column, or the RHS of the
+# consensus FD) or the two LHSs of the marriage, and the plan of the FDSet left to
+# the sub-tables (child). The plans are cached by FDSet, so the FDs are reduced once
+# per distinct FDSet instead of once per sub-table of the recursion.
+class ReductionPlan:
+    def __init__(self, delta):
+        self.delta = delta.copy()
+        self.col, self.lhs1, self.lhs2, self.child = None, None, None, None
+        if self.delta.n == 0:
+            self.step = ReductionStep.NO_FD
+            return
+        col = self.delta.find_common_lhs()
+        if col is not None:
+            self.step, self.col = ReductionStep.COMMON_LHS, col
+            self.child = plan_reduction(self.delta.remove_cols([col]))
+            return
+        fd_id = self.delta.find_consensus_fd_id()
+        if fd_id is not None:
+            self.step = ReductionStep.CONSENSUS
+            self.col = self.delta.fds[fd_id].rhs.col
+            self.child = plan_reduction(self.delta.remove_cols([self.col]))
+            return
+        lhs_marriage_or_none = self.delta.find_lhs_marriage()
+        if lhs_marriage_or_none is not None:
+            self.step = ReductionStep.LHS_MARRIAGE
+            self.lhs1, self.lhs2 = lhs_marriage_or_none
+            self.child = plan_reduction(
+                self.delta.remove_cols(
+                    copy.deepcopy(self.lhs1.cols) + copy.deepcopy(self.lhs2.cols)
+                )
+            )
+            return
+        self.step = ReductionStep.IRREDUCIBLE
+
+    # whether the FDSet reduces to no FD
+    def succeeds(self):
+        plan = self
+        while plan.child is not None:
+            plan = plan.child
+        return plan.step == ReductionStep.NO_FD
+
+
+# the plans by FDSet key: the FDs in order (the reductions pick the first column or
+# FD that applies, so two orders of the same FDs may be reduced differently)
+_plans = {}
+
+
+def _fdset_key(delta):
+    return tuple(
+        (tuple(fd.lhs.cols), fd.rhs.col) for fd in delta.fds if not fd.is_trivial()
+    )
+
+
+# the (cached) ReductionPlan of a FDSet; the cache lives as long as the process, so
+# a solver only derives the plans that no earlier solver of the process derived
+def plan_reduction(delta):
+    key = _fdset_key(delta)
+    tracing.count("reduction_plan_lookups")
+    if key not in _plans:
+        tracing.count("reduction_plans")
+        _plans[key] = ReductionPlan(delta)
+    return _plans[key]
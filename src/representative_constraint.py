@@ -23,7 +23,7 @@ class RepresentativeConstraint:
         assert isinstance(cd, ColorDistribution)
         n = cd.sum()
         for i in range(cd.c):
-            ni, pi = cd.d[i], self.constraint[self.labels[i]]
+            ni, pi = cd.get_c(i), self.constraint[self.labels[i]]
             if ni < n * pi.numerator / pi.denominator:
                 return False
         return True
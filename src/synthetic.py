@@ -0,0 +1,171 @@
+import argparse
+import os
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+
+# The FD shapes of the synthetic relations. Each column is either a root (its values
+# drawn at random) or a coarsening of a finer column (so that the finer column
+# determines it), which makes every FD of the shape hold on the clean relation:
+#   chain:        A -> B, A,B -> C      (LHSs form a chain, lhschain_dp applies)
+#   non_chain:    A -> B, B -> C, D -> E (no chain, the NP-hard case)
+#   consensus:    -> A, B -> C           (A is constant in the clean relation)
+#   lhs_marriage: A -> B, B -> A, A -> C (A and B are in one-to-one correspondence)
+SHAPES = {
+    "chain": ["A -> B", "A,B -> C"],
+    "non_chain": ["A -> B", "B -> C", "D -> E"],
+    "consensus": ["-> A", "B -> C"],
+    "lhs_marriage": ["A -> B", "B -> A", "A -> C"],
+}
+# column -> the finer column it is a coarsening (or, for lhs_marriage, a renaming) of
+_PARENTS = {
+    "chain": {"B": "A", "C": "B"},
+    "non_chain": {"B": "A", "C": "B", "E": "D"},
+    "consensus": {"C": "B"},
+    "lhs_marriage": {"B": "A", "C": "A"},
+}
+
+
+# the default cardinality of each column: the roots get n / 20 distinct values, and
+# each coarsening 10 times fewer than its parent (at least 2)
+def default_cardinality(n, shape):
+    cardinality = {}
+    for fd in SHAPES[shape]:
+        lhs, rhs = fd.split("->")
+        for col in [c.strip() for c in lhs.split(",") if c.strip() != ""] + [
+            rhs.strip()
+        ]:
+            cardinality[col] = max(2, n // 20)
+    for col, parent in _PARENTS[shape].items():
+        cardinality[col] = max(2, cardinality[parent] // 10)
+    if shape == "consensus":
+        cardinality["A"] = 1
+    if shape == "lhs_marriage":
+        cardinality["B"] = cardinality["A"]
+    return cardinality
+
+
+# input: the number of rows n, a shape (a key of SHAPES), the cardinality of each
+#        column (a dict, the defaults for the missing ones), the noise rate (the
+#        fraction of rows whose RHS of a random FD is replaced by a random value), the
+#        number of colors and the skew of their distribution (color k is drawn with
+#        probability proportional to skew^-k)
+# output: (a dataframe, the lines of the FD set, the lines of the RC); the RC asks for
+#         the share of each color that occurs in the relation (rounded down to 1/100;
+#         a color the draw misses is left out, as the labels are read from the data)
+def generate(
+    n, shape="chain", cardinality=None, noise=0.1, n_colors=2, skew=2.0, seed=0
+):
+    r = np.random.RandomState(seed)
+    card = default_cardinality(n, shape)
+    card.update(cardinality or {})
+    parents = _PARENTS[shape]
+
+    # the clean relation: roots first, then every coarsening of its parent
+    cols = {}
+    for col in sorted(card, key=lambda c: (c in parents, c)):
+        if col in parents:
+            continue
+        cols[col] = r.randint(0, card[col], size=n)
+    while len(cols) < len(card):
+        for col, parent in parents.items():
+            if col in cols or parent not in cols:
+                continue
+            if shape == "lhs_marriage" and col == "B":
+                # a renaming of A
+                cols[col] = r.permutation(card[parent])[cols[parent]]
+            else:
+                cols[col] = cols[parent] * card[col] // card[parent]
+
+    # noise: a random FD of a noisy row gets a random RHS value
+    fds = SHAPES[shape]
+    noisy = np.flatnonzero(r.rand(n) < noise)
+    which = r.randint(0, len(fds), size=noisy.shape[0])
+    for k, fd in enumerate(fds):
+        rhs = fd.split("->")[1].strip()
+        rows = noisy[which == k]
+        cols[rhs][rows] = r.randint(0, max(card[rhs], 2), size=rows.shape[0])
+
+    # the representative column
+    p = float(skew) ** -np.arange(n_colors)
+    p /= p.sum()
+    cols["COLOR"] = r.choice(n_colors, size=n, p=p)
+    cols["ID"] = np.arange(n)
+    df = pd.DataFrame(cols)[sorted(card) + ["COLOR", "ID"]]
+
+    counts = np.bincount(cols["COLOR"], minlength=n_colors)
+    colors = np.flatnonzero(counts > 0)
+    # written as n/d even when the fraction is 0 or 1, as the RC loader expects
+    shares = [Fraction(int(counts[k] * 100 // n), 100) for k in colors]
+    rc = [
+        "COLOR",
+        ",".join(str(k) for k in colors),
+        ",".join(f"{f.numerator}/{f.denominator}" for f in shares),
+    ]
+    return df, fds, rc
+
+
+# write a synthetic instance in the layout of data/input_data_*:
+# {n}_{noise}_dirty.csv, {shape}_fdset.txt and COLOR_rc.txt under out_dir
+# output: (the relation, the FD set, the RC) filenames
+def write_instance(out_dir, n, shape="chain", noise=0.1, **kwargs):
+    df, fds, rc = generate(n, shape, noise=noise, **kwargs)
+    os.makedirs(out_dir, exist_ok=True)
+    relation = os.path.join(out_dir, f"{n}_{noise}_dirty.csv")
+    fdset = os.path.join(out_dir, f"{shape}_fdset.txt")
+    rc_filename = os.path.join(out_dir, "COLOR_rc.txt")
+    df.to_csv(relation, index=False)
+    with open(fdset, "w") as fout:
+        fout.write("\n".join(fds))
+    with open(rc_filename, "w") as fout:
+        fout.write("\n".join(rc))
+    return relation, fdset, rc_filename
+
+
+# "A=1000,B=100" -> {"A": 1000, "B": 100}
+def parse_cardinality(s):
+    if s is None or s == "":
+        return None
+    return {k: int(v) for k, v in (item.split("=") for item in s.split(","))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--out_dir",
+        type=str,
+        default="../data/synthetic/",
+        help="the (related) output directory",
+    )
+    parser.add_argument("--rows", type=int, default=10000, help="the number of rows")
+    parser.add_argument(
+        "--shape", type=str, default="chain", choices=list(SHAPES.keys())
+    )
+    parser.add_argument(
+        "--cardinality",
+        type=str,
+        default=None,
+        help="(Optional) the cardinality of some columns, e.g., A=1000,B=100",
+    )
+    parser.add_argument("--noise", type=float, default=0.1, help="the noise rate")
+    parser.add_argument("--n_colors", type=int, default=2)
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=2.0,
+        help="color k is drawn with probability proportional to skew^-k",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = write_instance(
+        args.out_dir,
+        args.rows,
+        args.shape,
+        noise=args.noise,
+        cardinality=parse_cardinality(args.cardinality),
+        n_colors=args.n_colors,
+        skew=args.skew,
+        seed=args.seed,
+    )
+    print("\n".join(files))
@@ -1,8 +1,39 @@
+import numpy as np
 import pandas as pd
 from color_distribution import ColorDistribution
 
 
+# dictionary-encode a column into int32 codes and the (str) value of each code; the
+# codes follow the sorted order of the values as strings, so grouping and sorting
+# by codes orders the groups as grouping and sorting by the values would
+def _encode(col):
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    values = np.asarray(pd.Index(uniques).astype(str), dtype=object)
+    order = np.argsort(values, kind="stable")
+    rank = np.empty(order.shape[0], dtype=np.int32)
+    rank[order] = np.arange(order.shape[0], dtype=np.int32)
+    return rank[codes], values[order]
+
+
+# the ids of the distinct rows of n values of some columns (a list of arrays), in
+# the order of their first appearance
+def factorize_rows(columns, n):
+    codes = np.zeros(n, dtype=np.int64)
+    for column in columns:
+        col_codes, uniques = pd.factorize(column)
+        codes = pd.factorize(codes * uniques.shape[0] + col_codes)[0]
+    return codes
+
+
+# A Table is a view of a base relation (a dataframe of codes, shared by all the
+# tables derived from it): the positions rows of its tuples in the base, in order.
+# Sub-tables, copies and unions of views of the same base only slice or concatenate
+# the positions, so the recursion of s_repair takes O(n) memory at any depth; the
+# dataframe df of a view is materialized (with a fresh index) only when it is read.
 class Table:
+    # dicts: the values of the codes of each dictionary-encoded column (the
+    # representative column is encoded by labels instead)
+    # base, rows: a Table whose base relation is shared, and the positions in it
     def __init__(
         self,
         representative_column=None,
@@ -12,117 +43,203 @@ class Table:
         delimeter=",",
         index_col=None,
         dropna=True,
+        dicts=None,
+        base=None,
+        rows=None,
     ):
         self.representative_column = representative_column
 
         if filename is not None:
-            self.df = pd.read_csv(filename, delimiter=delimeter, index_col=index_col)
+            df = pd.read_csv(filename, delimiter=delimeter, index_col=index_col)
             if dropna:
-                self.df = self.df.dropna().reset_index(drop=True)
-            # discretize the representative column into non-negative numbers
-            self.missing_cnt = self.df.isnull().sum()
-            self.df = self.df.astype(str)
+                df = df.dropna().reset_index(drop=True)
+            self.missing_cnt = df.isnull().sum()
             self.labels = None
+            self.dicts = {}
+            for col in df.columns:
+                if col == self.representative_column:
+                    # discretize the representative column into non-negative numbers
+                    df[col], self.labels = pd.factorize(df[col].astype(str))
+                else:
+                    df[col], self.dicts[col] = _encode(df[col])
             if self.representative_column:
-                assert self.representative_column in self.df.columns
-                self.df[self.representative_column], self.labels = pd.factorize(
-                    self.df[self.representative_column]
-                )
-        elif df is not None:
-            self.df = df
+                assert self.representative_column in df.columns
+        elif df is not None or base is not None:
             self.labels = labels
+            self.dicts = dicts
         else:
             raise ValueError("Create a new table without data source")
 
+        if base is not None:
+            self.base = base.base
+            self._columns = base._columns
+            self.rows = np.asarray(rows, dtype=np.int64)
+            self._df = None
+        else:
+            if not df.index.equals(pd.RangeIndex(df.shape[0])):
+                df = df.reset_index(drop=True)
+            self.base = df
+            # the NumPy array of each column of the base, shared by all the views
+            self._columns = {}
+            self.rows = np.arange(df.shape[0], dtype=np.int64)
+            self._df = df
+
         if self.representative_column:
             self._collect_color_distribution()
 
+    # the dataframe of the tuples of the view (materialized on first use)
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = pd.DataFrame(
+                {col: self.column(col) for col in self.base.columns}
+            )
+        return self._df
+
+    # the NumPy array of a column, restricted to the tuples of the view
+    def column(self, col):
+        if col not in self._columns:
+            self._columns[col] = self.base[col].to_numpy()
+        return self._columns[col][self.rows]
+
+    # the view of the given positions of the base
+    def _view(self, rows):
+        return Table(
+            self.representative_column,
+            labels=self.labels,
+            dicts=self.dicts,
+            base=self,
+            rows=rows,
+        )
+
     def _collect_color_distribution(self):
         assert self.representative_column is not None
-        _d = {}
-        _df = self.df.groupby([self.representative_column]).size()
-        for i in range(self.labels.shape[0]):
-            _d[i] = 0
-        # for idx, val in _df.iteritems():
-        for idx, val in _df.items():
-            _d[idx] += val
-        self.color_distribution = ColorDistribution(self.labels.shape[0], _d)
+        counts = np.bincount(
+            self.column(self.representative_column), minlength=self.labels.shape[0]
+        )
+        self.color_distribution = ColorDistribution.from_counts(counts.tolist())
 
     def nrows(self):
-        return self.df.shape[0]
+        return self.rows.shape[0]
 
     def npairs(self):
         return self.nrows() * (self.nrows() - 1) // 2
 
     def ncols(self):
-        return self.df.shape[1]
-
-    def _get_subrows_by_filter(self, column_name, equal_to):
-        return self.df[self.df[column_name] == equal_to]
+        return self.base.shape[1]
 
-    def get_subtable_by_filter(self, column_name, equal_to):
-        return Table(
-            self.representative_column,
-            self._get_subrows_by_filter(column_name, equal_to).reset_index(drop=True),
-            self.labels,
-        )
+    # the sub-table of the rows at the given positions
+    def get_subtable_by_positions(self, idxs):
+        return self._view(self.rows[idxs])
 
     # return an empty table with the old header
     def get_empty_table(self):
-        empty_df = self.df.iloc[0:0]
-        return Table(self.representative_column, empty_df, self.labels)
-
-    def get_distinct_vals_of(self, col):
-        return self.df[col].unique().tolist()
+        return self._view(self.rows[0:0])
+
+    # the sub-tables of the distinct values of col (in the order of their first
+    # appearance), with one factorization and one stable sort instead of a scan per
+    # value
+    def partition(self, col):
+        return self.group([col])[1]
+
+    # the sub-tables of the distinct combinations of values of cols (in the order of
+    # their first appearance), and the combination of each (a row of codes)
+    def group(self, cols):
+        columns = [self.column(col) for col in cols]
+        codes = factorize_rows(columns, self.nrows())
+        n_groups = codes.max(initial=-1) + 1
+        if n_groups == 0:
+            return np.empty((0, len(cols)), dtype=np.int64), []
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=n_groups))[:-1]
+        first = order[np.r_[0, bounds]]
+        keys = np.stack([column[first] for column in columns], axis=1)
+        return keys, [self._view(self.rows[idxs]) for idxs in np.split(order, bounds)]
 
     def get_representative_column_distribution(self):
         assert self.labels is not None and self.representative_column is not None
         self._collect_color_distribution()
         d = {}
         for color in range(self.color_distribution.c):
-            d[self.labels[color]] = self.color_distribution.d[color]
+            d[self.labels[color]] = self.color_distribution.get_c(color)
         return d
 
     def __add__(self, other):
+        if self.base is other.base:
+            return self._view(np.concatenate([self.rows, other.rows]))
         _df = pd.concat([self.df, other.df], axis=0, ignore_index=True)
-        return Table(self.representative_column, _df, self.labels)
+        return Table(self.representative_column, _df, self.labels, dicts=self.dicts)
 
     def __iadd__(self, other):
-        self.df = pd.concat([self.df, other.df], axis=0, ignore_index=True)
+        if self.base is other.base:
+            self.rows = np.concatenate([self.rows, other.rows])
+            self._df = None
+        else:
+            self.base = pd.concat([self.df, other.df], axis=0, ignore_index=True)
+            self._columns = {}
+            self.rows = np.arange(self.base.shape[0], dtype=np.int64)
+            self._df = self.base
         if self.representative_column is not None:
             self._collect_color_distribution()
         return self
 
-    # a dataframe contains all the possible combination of (lhs1, lhs2)
+    # the sub-tables of all the combinations of (lhs1, lhs2), in the order of their
+    # first appearance, and the ids of their lhs1 and of their lhs2 values (numbered
+    # in the order of their first appearance)
     def group_by_two_lhs(self, lhs1, lhs2):
-        return self.df[lhs1.cols + lhs2.cols].drop_duplicates(ignore_index=True)
-
-    def get_subtable_by_query(self, query):
-        _df = self.df.query(query).reset_index(drop=True)
-        return Table(self.representative_column, _df, self.labels)
+        keys, subs = self.group(lhs1.cols + lhs2.cols)
+        k = len(lhs1.cols)
+        les = factorize_rows(list(keys[:, :k].T), keys.shape[0])
+        ris = factorize_rows(list(keys[:, k:].T), keys.shape[0])
+        return les, ris, subs
 
+    # the first nums[k] tuples of each color k (in the order of nums)
     def get_subtable_by_nums(self, nums):
         assert self.representative_column is not None
-        res = self.get_empty_table()
-        for k, v in nums.items():
-            res = res + Table(
-                self.representative_column,
-                self.df.loc[self.df[self.representative_column] == k].head(v),
-                self.labels,
+        colors = self.column(self.representative_column)
+        return self._view(
+            np.concatenate(
+                [self.rows[0:0]] + [self.rows[colors == k][:v] for k, v in nums.items()]
             )
-        return res
+        )
 
+    # the views are immutable (__iadd__ replaces rows), so a copy shares them
     def copy(self):
-        return Table(self.representative_column, self.df.copy(), self.labels)
+        return self._view(self.rows)
 
+    # decode the columns back to their values for output
     def __repr__(self):
         _df = self.df.copy()
-        if self.representative_column:
-            for index in self.df.index:
-                color = _df.at[index, self.representative_column]
-                # color = _df.at[index, self.representative_column].item()
-                _df.at[index, self.representative_column] = self.labels[color]
+        for col in _df.columns:
+            codes = _df[col].to_numpy()
+            if col == self.representative_column:
+                _df[col] = np.asarray(self.labels, dtype=object)[codes]
+            elif self.dicts is not None and col in self.dicts:
+                _df[col] = self.dicts[col][codes]
         return _df.to_string(index=False)
 
     def __str__(self):
         return self.__repr__()
+
+
+# A repair in the frontier of a DP is either a Table or a back-pointer (left, right)
+# to the two repairs it is the union of; rebuild it into a single Table (the tuples
+# of left before those of right)
+def materialize(repair):
+    tables = []
+    stack = [repair]
+    while len(stack) > 0:
+        r = stack.pop()
+        if isinstance(r, tuple):
+            stack.append(r[1])
+            stack.append(r[0])
+        else:
+            tables.append(r)
+    res = tables[0]
+    if len(tables) == 1:
+        return res
+    if all(t.base is res.base for t in tables):
+        return res._view(np.concatenate([t.rows for t in tables]))
+    for t in tables[1:]:
+        res = res + t
+    return res
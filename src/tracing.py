@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+import json
+from time import time
+
+
+# A Tracer records the wall-clock time of nested phases (spans), counters and
+# per-key statistics of one run. Spans are aggregated by their path, e.g.
+# "solve/s_repair/s_repair/lp_relaxation", so that a recursion adds one entry per
+# depth rather than one per call.
+class Tracer:
+    # stack: the open spans to start under (those of the caller, in a worker process)
+    def __init__(self, stack=None):
+        self.stack = list(stack or [])
+        self.spans = {}
+        self.counters = {}
+        self.stats = {}
+
+    @contextmanager
+    def span(self, name):
+        self.stack.append(name)
+        start_ts = time()
+        try:
+            yield
+        finally:
+            path = "/".join(self.stack)
+            self.stack.pop()
+            if path not in self.spans:
+                self.spans[path] = {"calls": 0, "time": 0.0}
+            self.spans[path]["calls"] += 1
+            self.spans[path]["time"] += time() - start_ts
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    # the count, sum and max of the values of name observed under key
+    def observe(self, name, value, key=None):
+        key = str(key)
+        if name not in self.stats:
+            self.stats[name] = {}
+        if key not in self.stats[name]:
+            self.stats[name][key] = {"count": 0, "sum": 0, "max": value}
+        stat = self.stats[name][key]
+        stat["count"] += 1
+        stat["sum"] += value
+        stat["max"] = max(stat["max"], value)
+
+    # the number of open spans named name
+    def depth(self, name):
+        return self.stack.count(name)
+
+    # add the spans, counters and stats of another tracer (its to_dict())
+    def merge(self, trace):
+        for path, sp in trace["spans"].items():
+            if path not in self.spans:
+                self.spans[path] = {"calls": 0, "time": 0.0}
+            self.spans[path]["calls"] += sp["calls"]
+            self.spans[path]["time"] += sp["time"]
+        for name, value in trace["counters"].items():
+            self.count(name, value)
+        for name, stats in trace["stats"].items():
+            if name not in self.stats:
+                self.stats[name] = {}
+            for key, stat in stats.items():
+                if key not in self.stats[name]:
+                    self.stats[name][key] = dict(stat)
+                    continue
+                mine = self.stats[name][key]
+                mine["count"] += stat["count"]
+                mine["sum"] += stat["sum"]
+                mine["max"] = max(mine["max"], stat["max"])
+
+    def to_dict(self):
+        return {"spans": self.spans, "counters": self.counters, "stats": self.stats}
+
+    def dump(self, filename):
+        with open(filename, "w") as fout:
+            json.dump(self.to_dict(), fout, indent=1)
+
+
+# the tracer of the running solver; without one, the hooks below do nothing
+_tracer = None
+
+
+def start(stack=None):
+    global _tracer
+    _tracer = Tracer(stack)
+    return _tracer
+
+
+def stop():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+@contextmanager
+def span(name):
+    if _tracer is None:
+        yield
+    else:
+        with _tracer.span(name):
+            yield
+
+
+def count(name, value=1):
+    if _tracer is not None:
+        _tracer.count(name, value)
+
+
+def observe(name, value, key=None):
+    if _tracer is not None:
+        _tracer.observe(name, value, key)
+
+
+# the open spans of the running solver (to resume them in a worker process)
+def stack():
+    return list(_tracer.stack) if _tracer is not None else None
+
+
+def merge(trace):
+    if _tracer is not None:
+        _tracer.merge(trace)
+
+
+def depth(name):
+    return _tracer.depth(name) if _tracer is not None else 0
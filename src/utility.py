@@ -1,52 +1,28 @@
+from conflict_graph import build_conflict_graph, factorize_fd
+import numpy as np
+
 global_random_seed = 2023
 eps = 1e-8
 
 
 def compute_pairwise_violations(t, delta):
-    cnt = 0
-    added = {}
-    for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            for i in range(len(all_idxs)):
-                for j in range(i + 1, len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        for jj in all_idxs[j]:
-                            if (ii, jj) not in added:
-                                cnt += 1
-                                added[(ii, jj)] = 1
-    return cnt
+    return build_conflict_graph(t.df, delta).nedges()
 
 
 def compute_violated_tuples(t, delta):
-    idx_to_is_violated = {}
-    for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            if len(all_idxs) > 1:
-                for i in range(len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        idx_to_is_violated[ii] = True
-    return len(idx_to_is_violated)
+    return build_conflict_graph(t.df, delta).violated_nodes().shape[0]
 
 
 def check_fds(t, delta):
     for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            if len(list(rhs_grouped.groups.items())) > 1:
-                print("Error: FD violated")
-                print(rhs_grouped.groups)
-                return False
+        # an FD holds iff every LHS group (a single group for a consensus FD) has
+        # a single RHS value
+        lhs_codes, rhs_codes = factorize_fd(t.df, fd)
+        pairs = np.unique(np.stack([lhs_codes, rhs_codes]), axis=1)
+        if np.unique(pairs[0]).shape[0] < pairs.shape[1]:
+            print("Error: FD violated")
+            print(fd)
+            return False
     return True
 
 
@@ -1,5 +1,6 @@
 import networkx as nx
-from table import Table
+from conflict_graph import build_conflict_graph
+from compression import CompressedTable
 import numpy as np
 import pandas as pd
 import random
@@ -21,24 +22,10 @@ def build_violation_graph(t, delta, seed=None):
     G = nx.Graph()
 
     # Add vertices for each tuple
-    num_tuples = t.df.shape[0]
-    for i in range(num_tuples):
-        G.add_node(i)
+    G.add_nodes_from(range(t.df.shape[0]))
 
     # Check FD violations and add edges
-    for fd in delta.fds:
-        lhs_grouped = t.df.groupby(fd.lhs.cols)
-        for _, lhs_idxs in lhs_grouped.groups.items():
-            rhs_grouped = t.df.loc[lhs_idxs].groupby(fd.rhs.col)
-            all_idxs = []
-            for _, rhs_idxs in rhs_grouped.groups.items():
-                all_idxs.append(rhs_idxs.tolist())
-            for i in range(len(all_idxs)):
-                for j in range(i + 1, len(all_idxs)):
-                    for ii in all_idxs[i]:
-                        for jj in all_idxs[j]:
-                            if not G.has_edge(ii, jj):
-                                G.add_edge(ii, jj)
+    G.add_edges_from(build_conflict_graph(t.df, delta).edge_list())
     # add randomness
     G = add_randomness(G, seed=seed)
 
@@ -53,12 +40,33 @@ def find_vertex_cover(graph):
     # vertex cover is the set that going to remove
 
 
+def find_weighted_vertex_cover(graph, weights):
+    # local ratio (Bar-Yehuda & Even): pay for each edge with the smaller residual
+    # weight of its endpoints; the nodes paid in full form a 2-approximate cover
+    residual = {u: weights[u] for u in graph.nodes()}
+    for u, v in graph.edges():
+        if residual[u] > 0 and residual[v] > 0:
+            eps = min(residual[u], residual[v])
+            residual[u] -= eps
+            residual[v] -= eps
+    vertex_cover = {u for u in graph.nodes() if residual[u] == 0}
+    return vertex_cover
+
+
 # input: a Table t, a FDSet delta
 # output: (Sub-)Table (without conflicts)
-def vertex_cover_approximation(t, delta, seed=None):
+def vertex_cover_approximation(t, delta, seed=None, compress=False):
+    if compress:
+        # identical tuples (w.r.t. FDs) become one node weighted by their count
+        ct = CompressedTable(t, delta)
+        violation_graph = build_violation_graph(ct.table, delta, seed=seed)
+        vertex_cover = find_weighted_vertex_cover(violation_graph, ct.counts)
+        return ct.get_subtable_by_kept(
+            [0 if i in vertex_cover else ct.counts[i] for i in range(ct.nclasses())]
+        )
     violation_graph = build_violation_graph(t, delta, seed=seed)
     vertex_cover = find_vertex_cover(violation_graph)
     # remove tuple in vertex cover and get a subtable
     idxs = [i for i in range(t.df.shape[0]) if i not in vertex_cover]
-    opt_t = Table(t.representative_column, t.df.iloc[idxs], t.labels)
+    opt_t = t.get_subtable_by_positions(idxs)
     return opt_t